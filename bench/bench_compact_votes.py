@@ -0,0 +1,52 @@
+"""Memory and lookup cost of CompactVotes against a plain dict.
+
+Run from the repository root: python bench/bench_compact_votes.py [voters]
+"""
+
+import random
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cogs.poll_store import CompactVotes  # noqa: E402
+
+
+def measure(build):
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def main(voters: int = 50_000):
+    rng = random.Random(1)
+    # Discord snowflakes: 64-bit, well outside the small int cache
+    users = [rng.getrandbits(63) for _ in range(voters)]
+    answers = [rng.randrange(10) for _ in range(voters)]
+
+    votes, dict_size = measure(lambda: dict(zip(users, answers)))
+    compact, compact_size = measure(lambda: CompactVotes(votes))
+
+    probes = rng.sample(users, 1000)
+    n = 200
+    dict_time = timeit.timeit(lambda: [votes.get(u) for u in probes], number=n)
+    compact_time = timeit.timeit(lambda: [compact.get(u) for u in probes], number=n)
+
+    print(f"{voters} voters")
+    # The dict shares the int objects in `users`, so only its table is counted
+    print(
+        f"  memory: dict table {dict_size / 2**20:.2f} MB, "
+        f"compact {compact_size / 2**20:.2f} MB"
+    )
+    print(
+        f"  lookup: dict {dict_time / n / len(probes) * 1e9:.0f} ns, "
+        f"compact {compact_time / n / len(probes) * 1e9:.0f} ns"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,104 @@
+"""Per-render cost of create_message with the cached PollTemplate, against
+the previous implementation that rebuilt the select options, view and bar
+strings on every render (kept below for comparison).
+
+Run from the repository root: python bench/bench_create_message.py
+"""
+
+import asyncio
+import math
+import sys
+import timeit
+from pathlib import Path
+from typing import *
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import discord  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from cogs.polls import (  # noqa: E402
+    POLL_PLACEHOLDERS,
+    Poll,
+    PollSelect,
+    create_message,
+)
+
+
+def create_message_uncached(poll: Poll, ended: bool) -> Dict:
+    """create_message as it was before PollTemplate."""
+
+    def format_bar(votes: int) -> str:
+        value = (votes / total) if total > 0 else 0
+        s = "#" * int(value * barWidth) + "-" * int((1.0 - value) * barWidth)
+        percent = int(math.floor(value * 100.0))
+        if value == votes and value > 0:
+            s = f"[{s}]"
+        else:
+            s = f" {s} "
+
+        s = f"{s} {percent}%"
+
+        return s
+
+    barWidth: int = 20
+
+    votes, total = poll.results()
+
+    fields: List[discord.EmbedField] = [
+        discord.EmbedField(name=poll.answers[i], value=format_bar(votes[i]))
+        for i in range(len(poll.answers))
+    ]
+
+    options: List[discord.SelectOption] = [
+        discord.SelectOption(label="Сброс голоса", value="reset")
+    ]
+
+    options.extend(
+        [
+            discord.SelectOption(label=poll.answers[i], value=str(i))
+            for i in range(len(poll.answers))
+        ]
+    )
+
+    return {
+        "content": "Голосование завершено" if ended else "Голосование",
+        "embed": discord.Embed(
+            title=poll.title,
+            description=poll.description,
+            fields=fields,
+            colour=0x00AA22 if ended else 0x0022AA,
+        ),
+        "view": None
+        if ended
+        else discord.ui.View(
+            PollSelect(
+                placeholder=POLL_PLACEHOLDERS[poll.mode],
+                options=options,
+                max_values=len(options) if poll.mode == "multi" else 1,
+            ),
+            timeout=None,
+        ),
+    }
+
+
+async def main(answers: int = 10, voters: int = 1000, number: int = 5000):
+    # Measure rendering, not the logging sink
+    logger.remove()
+
+    poll = Poll(answers=[f"Ответ номер {i}" for i in range(answers)], messageId=1)
+    for user in range(voters):
+        poll.cast(user, user % answers)
+
+    print(f"{answers} answers, {voters} votes, {number} renders")
+    for label, render in (
+        ("before", create_message_uncached),
+        ("after", create_message),
+    ):
+        render(poll, False)
+        elapsed = timeit.timeit(lambda: render(poll, False), number=number)
+        print(f"  {label:6} {elapsed / number * 1e6:6.1f} us per render")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:])))
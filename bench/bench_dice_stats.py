@@ -0,0 +1,65 @@
+"""Timings of the exact distributions behind /roll stats for large pools.
+
+Terms are timed directly with cold caches, so expressions over the
+MAX_WORK budget are measured too; the last column says whether
+`distribution` would accept them.
+
+Run from the repository root: python bench/bench_dice_stats.py [expr ...]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cogs import dice_stats  # noqa: E402
+
+EXPRESSIONS = ["500d6", "100d6", "50d20kh10", "100d6kh50", "20d100kh3", "50d1000"]
+
+
+def parse_unbudgeted(expr: str):
+    budget = dice_stats.MAX_WORK
+    dice_stats.MAX_WORK = float("inf")
+    try:
+        return dice_stats.parse(expr)
+    finally:
+        dice_stats.MAX_WORK = budget
+
+
+def compute(expr: str) -> dice_stats.Dist:
+    """`distribution` without the budget check and its own cache."""
+    res = dice_stats.constant(0)
+    for sign, count, sides, kind, keep in parse_unbudgeted(expr):
+        if not sides:
+            dist = dice_stats.constant(count)
+        elif kind is None:
+            dist = dice_stats.sum_dice(count, sides)
+        elif kind == "h":
+            dist = dice_stats.keep_highest(count, sides, keep)
+        else:
+            dist = dice_stats.keep_lowest(count, sides, keep)
+        res = dice_stats.convolve(res, dice_stats.negate(dist) if sign < 0 else dist)
+    return res
+
+
+def main(expressions):
+    for expr in expressions:
+        try:
+            dice_stats.parse(expr)
+            accepted = "accepted"
+        except ValueError:
+            accepted = "over budget"
+
+        dice_stats.sum_dice.cache_clear()
+        dice_stats.keep_highest.cache_clear()
+        start = time.perf_counter()
+        dist = compute(expr)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{expr:12} {elapsed:7.3f}s  {len(dist.counts):6} outcomes  {accepted}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or EXPRESSIONS)
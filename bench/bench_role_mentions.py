@@ -0,0 +1,76 @@
+"""Role mention substitution: the old per-role str.replace loop against
+RoleMentioner's single regex pass.
+
+Run from the repository root: python bench/bench_role_mentions.py
+"""
+
+import itertools
+import random
+import sys
+import timeit
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# config.py holds deployment secrets and is not part of the repository
+try:
+    import config  # noqa: F401
+except ImportError:
+    sys.modules["config"] = types.ModuleType("config")
+
+from cogs.rabbit import RoleMentioner  # noqa: E402
+
+
+def replace_loop(text: str, roles) -> str:
+    for role_name, role in roles.items():
+        text = text.replace(f"@{role_name}", role.mention)
+    return text
+
+
+def make_roles(n: int, prefix: str):
+    # Same-length names: none is a prefix of another, which the old loop
+    # would mangle, so both versions give the same output
+    return {
+        f"{prefix}{i:03d}": types.SimpleNamespace(mention=f"<@&{10**17 + i}>")
+        for i in range(n)
+    }
+
+
+def make_text(roles, words: int, density: float, rng: random.Random) -> str:
+    """`words` words, a `density` share of which are role mentions."""
+    names = list(roles)
+    return " ".join(
+        f"@{rng.choice(names)}" if rng.random() < density else "word"
+        for _ in range(words)
+    )
+
+
+def bench(label: str, roles, text: str):
+    mentioner = RoleMentioner(roles)
+    assert mentioner(text) == replace_loop(text, roles)
+
+    n = max(1, 20_000 // len(text))
+    old = timeit.timeit(lambda: replace_loop(text, roles), number=n) / n
+    new = timeit.timeit(lambda: mentioner(text), number=n) / n
+    unit, scale = ("ms", 1e3) if old > 1e-3 else ("us", 1e6)
+    print(f"{label:48} {old * scale:8.1f} {unit} -> {new * scale:8.1f} {unit}")
+
+
+def main():
+    rng = random.Random(1)
+    # str.replace is slower on non-ASCII text, so try both kinds of names
+    for prefix, count in itertools.product(("Role", "Роль"), (200, 10)):
+        roles = make_roles(count, prefix)
+        # Worst case for the regex: a long message that is all
+        # mentions, so the per-match callback dominates
+        long = make_text(roles, 17_000, 1.0, rng)
+        short = make_text(roles, 30, 0.2, rng)
+        size = len(long.encode()) // 1024
+        label = f"{count} {prefix} roles"
+        bench(f"{label}, {size} KB message, all mentions", roles, long)
+        bench(f"{label}, short message", roles, short)
+
+
+if __name__ == "__main__":
+    main()
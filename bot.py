@@ -9,6 +9,7 @@ import dotenv
 from discord import ApplicationCommand
 from loguru import logger
 
+from cogs.guild_index import GuildIndex, MemberWeights
 from config import *
 
 intents = discord.Intents(members=True, reactions=True, messages=True)
@@ -93,24 +94,24 @@ async def on_ready():
 
     discord_bot.data["discord_guild"] = discord_guild
 
-    discord_channel = discord.utils.find(
-        lambda c: c.name == discord_channel_name, discord_guild.channels
+    guild_index = GuildIndex(discord_guild)
+    discord_bot.data["guild_index"] = guild_index
+    discord_bot.data["member_weights"] = MemberWeights(
+        guild_index, discord_bot.data["poll_role_weights"]
     )
+
+    discord_channel = guild_index.channel(discord_channel_name)
     if discord_channel is None:
         raise RuntimeError(f"Failed to join Discord channel {discord_channel_name}!")
 
-    discord_welcome_channel = discord.utils.find(
-        lambda c: c.name == discord_welcome_channel_name, discord_guild.channels
-    )
-    if discord_channel is None:
+    discord_welcome_channel = guild_index.channel(discord_welcome_channel_name)
+    if discord_welcome_channel is None:
         raise RuntimeError(
             f"Failed to join Discord channel {discord_welcome_channel_name}!"
         )
 
     for discord_role_name in discord_role_names:
-        discord_role: Optional[discord.Role] = discord.utils.find(
-            lambda r: r.name == discord_role_name, discord_guild.roles
-        )
+        discord_role: Optional[discord.Role] = guild_index.role(discord_role_name)
         if discord_role is None:
             raise RuntimeError(
                 f"No role {discord_role_name} in guild {discord_guild_name}!"
@@ -141,12 +142,42 @@ def main():
     dotenv.load_dotenv()
     token = str(os.getenv("TOKEN"))
     discord_bot.data["rabbit_url"] = str(os.getenv("RABBIT"))
+    discord_bot.data["rabbit_prefetch"] = int(os.getenv("RABBIT_PREFETCH", "10"))
+    discord_bot.data["rabbit_workers"] = int(os.getenv("RABBIT_WORKERS", "10"))
+    discord_bot.data["rabbit_batch_window"] = float(
+        os.getenv("RABBIT_BATCH_WINDOW", "0.5")
+    )
+    discord_bot.data["role_update_window"] = float(
+        os.getenv("ROLE_UPDATE_WINDOW", "1.5")
+    )
+    discord_bot.data["poll_render_interval"] = float(
+        os.getenv("POLL_RENDER_INTERVAL", "2.0")
+    )
+    discord_bot.data["poll_compact_every"] = int(
+        os.getenv("POLL_COMPACT_EVERY", "1000")
+    )
+    discord_bot.data["poll_fetch_concurrency"] = int(
+        os.getenv("POLL_FETCH_CONCURRENCY", "10")
+    )
+    discord_bot.data["poll_tally_cache_size"] = int(
+        os.getenv("POLL_TALLY_CACHE_SIZE", "100")
+    )
+    # "Role:weight,Role:weight"
+    discord_bot.data["poll_role_weights"] = {
+        name.strip(): int(weight)
+        for name, _, weight in (
+            item.rpartition(":")
+            for item in os.getenv("POLL_ROLE_WEIGHTS", "Сабы:2").split(",")
+            if item.strip()
+        )
+    }
 
     setup_logging("discord.log", True, True)
     # all_cogs = ("dice", "polls", "rabbit", "roles")
     # all_cogs = ("dice", "polls", "rabbit", "roles")
     # all_cogs = ("dice", "polls", "rabbit", "roles")
     all_cogs = (
+        "guild_index",
         "dice",
         "roles",
         "rabbit",
@@ -1,8 +1,27 @@
+import asyncio
+import re
+
 import d20
 import discord
 
 from discord import ApplicationContext
 from discord.ext import commands
+from loguru import logger
+
+from cogs.dice_stats import distribution, render
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# NdM, optionally keeping the highest/lowest k dice, plus a flat modifier
+BulkRollValidator = re.compile(r"^(\d+)d(\d+)(?:k([hl])(\d+))?([+-]\d+)?$", re.I)
+# Below this many dice d20's normal per-die output is short enough
+BULK_THRESHOLD = 100
+BULK_MAX_DICE = 1_000_000
+# Also keeps NumPy's int64 dice and their sum in range
+BULK_MAX_SIDES = 1_000_000
 
 
 def check_channel(name):
@@ -18,6 +37,86 @@ def check_channel(name):
     return commands.check(predicate)
 
 
+def roll_bulk(expr: str) -> str | None:
+    """Rolls a large simple NdM(kh/kl k)(+x) expression with NumPy.
+
+    Returns a compact summary with a face histogram instead of listing every
+    die, or None when the expression should go through d20 instead.
+    """
+    res = BulkRollValidator.match(expr)
+    if np is None or not res:
+        return None
+
+    count, sides = int(res[1]), int(res[2])
+    if count < BULK_THRESHOLD or sides < 1:
+        return None
+
+    if count > BULK_MAX_DICE:
+        return f"`{expr}`: слишком много кубиков (максимум {BULK_MAX_DICE})"
+
+    if sides > BULK_MAX_SIDES:
+        return f"`{expr}`: слишком много граней (максимум {BULK_MAX_SIDES})"
+
+    keep = int(res[4]) if res[3] else count
+    keep = min(max(keep, 0), count)
+    modifier = int(res[5]) if res[5] else 0
+
+    dice = np.random.default_rng().integers(1, sides + 1, size=count)
+    if keep == count:
+        kept = dice
+    elif keep == 0:
+        kept = dice[:0]
+    elif res[3].lower() == "h":
+        kept = np.partition(dice, count - keep)[count - keep :]
+    else:
+        kept = np.partition(dice, keep - 1)[:keep]
+
+    total = int(kept.sum()) + modifier
+
+    lines = [f"`{expr}` = **{total}**"]
+    if keep != count:
+        lines.append(f"оставлено {keep} из {count}")
+    lines.append(f"среднее {dice.mean():.2f}, мин {dice.min()}, макс {dice.max()}")
+
+    if sides <= 20:
+        counts = np.bincount(dice, minlength=sides + 1)[1:]
+        lines.append(" · ".join(f"{i + 1}: {c}" for i, c in enumerate(counts)))
+    else:
+        # Ten ranges; binning directly keeps memory independent of `sides`
+        edges = np.linspace(0, sides, 11).astype(int)
+        counts, _ = np.histogram(dice, bins=edges + 0.5)
+        lines.append(
+            " · ".join(
+                f"{lo + 1}-{hi}: {c}" for lo, hi, c in zip(edges, edges[1:], counts)
+            )
+        )
+
+    return "\n".join(lines)
+
+
+def roll_all(exprs: list[str]) -> tuple[list[str], int]:
+    """Rolls every expression, returning one output line per expression and
+    the number of expressions that failed."""
+    lines = []
+    failed = 0
+    for expr in exprs:
+        bulk = roll_bulk(expr)
+        if bulk is not None:
+            lines.append(bulk)
+            continue
+
+        try:
+            # d20 keeps parsed expressions in its own LFU cache
+            res = d20.roll(expr)
+        except d20.errors.RollError as e:
+            lines.append(f"`{expr}`: {e}")
+            failed += 1
+        else:
+            lines.append(str(res))
+
+    return lines, failed
+
+
 class DiceCog(commands.Cog):
     @discord.slash_command(
         name="roll",
@@ -31,24 +130,41 @@ class DiceCog(commands.Cog):
         if len(args) == 1 and args[0] == "help":
             await ctx.respond(
                 "Расширенный синтаксис: "
-                "<https://d20.readthedocs.io/en/latest/start.html#dice-syntax>",
+                "<https://d20.readthedocs.io/en/latest/start.html#dice-syntax>\n"
+                "`/roll stats 4d6kh3` - вероятности исходов "
+                "(NdM, khK/klK, +/- числа)",
                 ephemeral=True,
             )
             return
 
-        rolls = []
-        for arg in args:
-            try:
-                res = d20.roll(arg)
-            except d20.errors.RollError:
-                pass
-            else:
-                rolls.append(str(res))
+        if args and args[0] == "stats":
+            await self.stats(ctx, args[1:])
+            return
+
+        if not args:
+            return
+
+        lines, failed = roll_all(args)
 
-        if not rolls:
+        # Only errors: don't spam the channel
+        await ctx.respond("\n".join(lines), ephemeral=failed == len(args))
+
+    async def stats(self, ctx: ApplicationContext, exprs: list[str]):
+        if not exprs:
+            await ctx.respond("Укажите выражение: `/roll stats 4d6kh3`", ephemeral=True)
             return
 
-        await ctx.respond("\n".join(rolls))
+        await ctx.defer()
+        for expr in exprs:
+            try:
+                # Large pools take up to a second; keep the gateway responsive
+                dist = await asyncio.to_thread(distribution, expr)
+            except ValueError as e:
+                await ctx.respond(f"`{expr}`: {e}")
+            else:
+                await ctx.respond(render(expr, dist))
+
+        logger.debug(f"Distribution cache: {distribution.cache_info()}")
 
 
 def setup(bot):  # this is called by Pycord to setup the cog
@@ -0,0 +1,254 @@
+import functools
+import itertools
+import math
+import re
+from typing import *
+
+# One term of a sum: NdM, NdMkhK / NdMklK or a constant, with its sign
+TermValidator = re.compile(
+    r"\s*([+-])?\s*(?:(\d*)d(\d+)(?:k([hl])(\d+))?|(\d+))", re.I
+)
+
+MAX_DICE = 500
+MAX_SIDES = 1000
+# Budget for one expression in units of roughly 100 ns of big-integer work
+# (see the *_work estimates below), about a second
+MAX_WORK = 10_000_000
+
+
+class Dist(NamedTuple):
+    """Exact outcome distribution: ``counts[i]`` ways to roll ``lo + i``."""
+
+    lo: int
+    counts: Tuple[int, ...]
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+
+def constant(value: int) -> Dist:
+    return Dist(value, (1,))
+
+
+def convolve(a: Dist, b: Dist) -> Dist:
+    counts = [0] * (len(a.counts) + len(b.counts) - 1)
+    for i, x in enumerate(a.counts):
+        if x:
+            for j, y in enumerate(b.counts):
+                counts[i + j] += x * y
+
+    return Dist(a.lo + b.lo, tuple(counts))
+
+
+def negate(a: Dist) -> Dist:
+    return Dist(-(a.lo + len(a.counts) - 1), tuple(reversed(a.counts)))
+
+
+@functools.lru_cache(maxsize=64)
+def sum_dice(count: int, sides: int) -> Dist:
+    """Sum of `count` dice with `sides` faces.
+
+    Adding a die turns every count into the sum of a window of `sides`
+    previous counts, so each step is a prefix-sum pass with no products.
+    """
+    counts = [1]
+    for _ in range(count):
+        prefix = [0, *itertools.accumulate(counts)]
+        counts = [
+            prefix[min(i + 1, len(counts))] - prefix[max(i - sides + 1, 0)]
+            for i in range(len(counts) + sides - 1)
+        ]
+
+    return Dist(count, tuple(counts))
+
+
+@functools.lru_cache(maxsize=64)
+def keep_highest(count: int, sides: int, keep: int) -> Dist:
+    """Sum of the `keep` highest of `count` dice.
+
+    Faces are processed from the highest down. A state is (dice placed so
+    far, sum of kept dice); since the highest faces come first, the first
+    `keep` dice placed are exactly the kept ones. Once `keep` dice are
+    placed the sum is final and the remaining dice can take any lower face,
+    so the state is closed off with a single power instead of being carried
+    on.
+    """
+    keep = min(keep, count)
+    if keep == 0:
+        return Dist(0, (sides**count,))
+
+    res: Dict[int, int] = {}
+    states: Dict[Tuple[int, int], int] = {(0, 0): 1}
+    for face in range(sides, 0, -1):
+        next_states: Dict[Tuple[int, int], int] = {}
+        for (placed, s), ways in states.items():
+            left = count - placed
+            for c in range(left + 1):
+                kept = min(c, keep - placed)
+                w = ways * math.comb(left, c)
+                total = s + face * kept
+                if placed + c >= keep:
+                    # Remaining dice may show any of the (face - 1) lower faces
+                    w *= (face - 1) ** (left - c)
+                    if w:
+                        res[total] = res.get(total, 0) + w
+                else:
+                    key = (placed + c, total)
+                    next_states[key] = next_states.get(key, 0) + w
+
+        states = next_states
+
+    lo = min(res)
+    counts = [0] * (max(res) - lo + 1)
+    for value, ways in res.items():
+        counts[value - lo] = ways
+
+    return Dist(lo, tuple(counts))
+
+
+def keep_lowest(count: int, sides: int, keep: int) -> Dist:
+    # Mirror every die (v -> sides + 1 - v): the lowest dice become the
+    # highest ones and the kept sum becomes keep * (sides + 1) - sum
+    keep = min(keep, count)
+    mirrored = negate(keep_highest(count, sides, keep))
+    return Dist(mirrored.lo + keep * (sides + 1), mirrored.counts)
+
+
+def sum_work(count: int, sides: int) -> int:
+    # `count` prefix-sum passes over up to count * sides values, ~800 ns each
+    return count * count * sides * 4
+
+
+def keep_work(count: int, sides: int, keep: int) -> int:
+    # faces * states * dice, ~130 ns each
+    return sides * keep * keep * sides * count * 13 // 10
+
+
+def convolve_work(a: int, b: int) -> int:
+    # One product per pair of outcomes, ~300 ns each
+    return a * b * 3
+
+
+Term = Tuple[int, int, int, Optional[str], int]
+
+
+def parse(expr: str) -> List[Term]:
+    """Splits `expr` into (sign, count, sides, keep kind, keep) terms, with
+    constants as (sign, value, 0, None, 0). Checks the limits and the
+    estimated cost up front, so nothing over budget is ever computed.
+
+    Raises ValueError for anything else.
+    """
+    terms = []
+    pos = 0
+    dice = 0
+    work = 0
+    support = 1
+    expr = expr.strip()
+    while pos < len(expr):
+        term = TermValidator.match(expr, pos)
+        if not term or (pos > 0 and not term[1]):
+            raise ValueError(f"не могу разобрать `{expr[pos:]}`")
+        pos = term.end()
+        sign = -1 if term[1] == "-" else 1
+
+        if term[6] is not None:
+            terms.append((sign, int(term[6]), 0, None, 0))
+            continue
+
+        count = int(term[2]) if term[2] else 1
+        sides = int(term[3])
+        dice += count
+        if dice > MAX_DICE or not 1 <= sides <= MAX_SIDES:
+            raise ValueError(f"не больше {MAX_DICE} кубиков и {MAX_SIDES} граней")
+
+        if term[4] is None:
+            kind, keep = None, count
+            work += sum_work(count, sides)
+        else:
+            kind, keep = term[4].lower(), min(int(term[5]), count)
+            work += keep_work(count, sides, keep)
+
+        length = keep * (sides - 1) + 1
+        work += convolve_work(support, length)
+        support += length - 1
+        if work > MAX_WORK:
+            raise ValueError(f"`{expr}` слишком сложно посчитать")
+
+        terms.append((sign, count, sides, kind, keep))
+
+    return terms
+
+
+@functools.lru_cache(maxsize=64)
+def distribution(expr: str) -> Dist:
+    """Exact distribution of a sum of NdM, NdMkhK, NdMklK and constants.
+
+    Raises ValueError for anything else.
+    """
+    res = constant(0)
+    for sign, count, sides, kind, keep in parse(expr):
+        if not sides:
+            dist = constant(count)
+        elif kind is None:
+            dist = sum_dice(count, sides)
+        elif kind == "h":
+            dist = keep_highest(count, sides, keep)
+        else:
+            dist = keep_lowest(count, sides, keep)
+
+        res = convolve(res, negate(dist) if sign < 0 else dist)
+
+    return res
+
+
+def render(expr: str, dist: Dist, rows: int = 20, width: int = 20) -> str:
+    """Compact text chart: probability of each outcome (or range of outcomes,
+    when there are more than `rows`) and the chance to roll at least that.
+
+    Outcomes in the outer 0.05% on either side are left out of the chart.
+    """
+    total = dist.total
+    values = range(dist.lo, dist.lo + len(dist.counts))
+    mean = sum(v * c for v, c in zip(values, dist.counts)) / total
+    # Counts can be far beyond float range, so only divide exact sums
+    var = sum(v * v * c for v, c in zip(values, dist.counts)) / total - mean**2
+
+    cutoff = total // 2000
+    start, below = 0, 0
+    while below + dist.counts[start] <= cutoff:
+        below += dist.counts[start]
+        start += 1
+    end, above = len(dist.counts), 0
+    while above + dist.counts[end - 1] <= cutoff:
+        above += dist.counts[end - 1]
+        end -= 1
+
+    step = math.ceil((end - start) / rows)
+    buckets = []
+    for i in range(start, end, step):
+        chunk = dist.counts[i : min(i + step, end)]
+        lo = dist.lo + i
+        hi = lo + len(chunk) - 1
+        label = str(lo) if lo == hi else f"{lo}-{hi}"
+        buckets.append((label, sum(chunk)))
+
+    peak = max(c for _, c in buckets)
+    label_width = max(len(label) for label, _ in buckets)
+    at_least = total - below
+
+    lines = [
+        f"{expr}: среднее {mean:.2f}, σ {math.sqrt(max(var, 0)):.2f}, "
+        f"от {values[0]} до {values[-1]}",
+        f"{'':>{label_width}}  {'':<{width}}     =      ≥",
+    ]
+    for label, c in buckets:
+        bar = "█" * round(c / peak * width)
+        lines.append(
+            f"{label:>{label_width}} │{bar:<{width}} "
+            f"{c / total:6.1%} {at_least / total:6.1%}"
+        )
+        at_least -= c
+
+    return "```\n" + "\n".join(lines) + "\n```"
@@ -0,0 +1,197 @@
+from typing import *
+
+import discord
+from discord.ext import commands
+from loguru import logger
+
+
+class GuildIndex:
+    """Name and id lookup tables for the channels and roles of one guild.
+
+    Built once on ready and kept current by `GuildIndexCog` from gateway
+    events, so cogs don't need `discord.utils.find` scans over
+    `guild.channels` / `guild.roles`. Available as `bot.data["guild_index"]`.
+    """
+
+    def __init__(self, guild: discord.Guild):
+        self.guild = guild
+        self.channels_by_id: Dict[int, discord.abc.GuildChannel] = {}
+        self.channels_by_name: Dict[str, discord.abc.GuildChannel] = {}
+        self.roles_by_id: Dict[int, discord.Role] = {}
+        self.roles_by_name: Dict[str, discord.Role] = {}
+
+        for channel in guild.channels:
+            self.add_channel(channel)
+
+        for role in guild.roles:
+            self.add_role(role)
+
+    @staticmethod
+    def _add(by_id: Dict, by_name: Dict, entity):
+        by_id[entity.id] = entity
+        # Names are not unique; like `find`, the first one seen wins
+        by_name.setdefault(entity.name, entity)
+
+    @staticmethod
+    def _remove(by_id: Dict, by_name: Dict, entity):
+        by_id.pop(entity.id, None)
+        if entity.name in by_name and by_name[entity.name].id == entity.id:
+            del by_name[entity.name]
+            for other in by_id.values():
+                if other.name == entity.name:
+                    by_name[entity.name] = other
+                    break
+
+    def add_channel(self, channel: discord.abc.GuildChannel):
+        self._add(self.channels_by_id, self.channels_by_name, channel)
+
+    def remove_channel(self, channel: discord.abc.GuildChannel):
+        self._remove(self.channels_by_id, self.channels_by_name, channel)
+
+    def add_role(self, role: discord.Role):
+        self._add(self.roles_by_id, self.roles_by_name, role)
+
+    def remove_role(self, role: discord.Role):
+        self._remove(self.roles_by_id, self.roles_by_name, role)
+
+    def channel(self, key: int | str) -> Optional[discord.abc.GuildChannel]:
+        if isinstance(key, int):
+            return self.channels_by_id.get(key, None)
+
+        return self.channels_by_name.get(key, None)
+
+    def role(self, key: int | str) -> Optional[discord.Role]:
+        if isinstance(key, int):
+            return self.roles_by_id.get(key, None)
+
+        return self.roles_by_name.get(key, None)
+
+
+class MemberWeights:
+    """Poll vote weight of every guild member, by member id.
+
+    Weights are configured by role name; a member gets the highest weight of
+    their roles. Only members with a weight other than 1 are stored. Built
+    once from the member cache and kept current by `GuildIndexCog`, available
+    as `bot.data["member_weights"]`.
+    """
+
+    def __init__(self, index: GuildIndex, role_weights: Dict[str, int]):
+        self.index = index
+        self.role_names = role_weights
+        self.role_weights: Dict[int, int] = {}
+        self.weights: Dict[int, int] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        self.role_weights = {}
+        for role_name, weight in self.role_names.items():
+            role = self.index.role(role_name)
+            if role is None:
+                logger.warning(f"Role {role_name} not found!")
+            else:
+                self.role_weights[role.id] = weight
+
+        self.weights = {}
+        for member in self.index.guild.members:
+            self.update(member)
+
+    def is_weighted(self, role: discord.Role) -> bool:
+        return role.name in self.role_names or role.id in self.role_weights
+
+    def update(self, member: discord.Member):
+        # get_role is a binary search over the member's role ids
+        weight = max(
+            (w for role_id, w in self.role_weights.items() if member.get_role(role_id)),
+            default=1,
+        )
+        if weight == 1:
+            self.weights.pop(member.id, None)
+        else:
+            self.weights[member.id] = weight
+
+    def remove(self, member_id: int):
+        self.weights.pop(member_id, None)
+
+    def get(self, member_id: int) -> int:
+        return self.weights.get(member_id, 1)
+
+
+class GuildIndexCog(commands.Cog, name="GuildIndex"):
+    def __init__(self, bot):
+        self.bot = bot
+
+    def index(self, guild: discord.Guild) -> Optional[GuildIndex]:
+        index: Optional[GuildIndex] = self.bot.data.get("guild_index", None)
+        if index is None or index.guild.id != guild.id:
+            return None
+
+        return index
+
+    def weights(self, guild: discord.Guild) -> Optional[MemberWeights]:
+        weights: Optional[MemberWeights] = self.bot.data.get("member_weights", None)
+        if weights is None or weights.index.guild.id != guild.id:
+            return None
+
+        return weights
+
+    def role_changed(self, *roles: discord.Role):
+        weights = self.weights(roles[0].guild)
+        if weights and any(weights.is_weighted(role) for role in roles):
+            weights.rebuild()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if index := self.index(channel.guild):
+            index.add_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        if index := self.index(channel.guild):
+            index.remove_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        if index := self.index(after.guild):
+            index.remove_channel(before)
+            index.add_channel(after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        if index := self.index(role.guild):
+            index.add_role(role)
+            self.role_changed(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if index := self.index(role.guild):
+            index.remove_role(role)
+            self.role_changed(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if index := self.index(after.guild):
+            index.remove_role(before)
+            index.add_role(after)
+            self.role_changed(before, after)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        if weights := self.weights(member.guild):
+            weights.update(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if weights := self.weights(after.guild):
+            weights.update(after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        if weights := self.weights(member.guild):
+            weights.remove(member.id)
+
+
+def setup(bot):  # this is called by Pycord to setup the cog
+    bot.add_cog(GuildIndexCog(bot))  # add the cog to the bot
@@ -0,0 +1,290 @@
+import asyncio
+import base64
+import bisect
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import *
+
+from loguru import logger
+
+
+class CompactVotes:
+    """Memory-efficient replacement for the ``user id -> answer`` dict.
+
+    User ids are kept sorted in an ``array('Q')`` with the matching answer
+    indices in a parallel ``array('B')``, so an entry costs 9 bytes instead of
+    a dict slot plus two int objects. Lookups are a binary search; inserts
+    shift the tail of both arrays with a single memmove.
+    """
+
+    def __init__(self, votes: Optional[Dict[int, int]] = None):
+        self.users = array("Q")
+        self.answers = array("B")
+        if votes:
+            for user in sorted(votes):
+                self.users.append(user)
+                self.answers.append(votes[user])
+
+    def find(self, user: int) -> int:
+        i = bisect.bisect_left(self.users, user)
+        if i < len(self.users) and self.users[i] == user:
+            return i
+
+        return -1
+
+    def get(self, user: int, default=None):
+        i = self.find(user)
+        return self.answers[i] if i >= 0 else default
+
+    def __getitem__(self, user: int) -> int:
+        i = self.find(user)
+        if i < 0:
+            raise KeyError(user)
+
+        return self.answers[i]
+
+    def __setitem__(self, user: int, answer: int):
+        i = bisect.bisect_left(self.users, user)
+        if i < len(self.users) and self.users[i] == user:
+            self.answers[i] = answer
+        else:
+            self.users.insert(i, user)
+            self.answers.insert(i, answer)
+
+    def pop(self, user: int, default=None):
+        i = self.find(user)
+        if i < 0:
+            return default
+
+        answer = self.answers[i]
+        del self.users[i]
+        del self.answers[i]
+        return answer
+
+    def __contains__(self, user: int) -> bool:
+        return self.find(user) >= 0
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def values(self):
+        return self.answers
+
+    def items(self):
+        return zip(self.users, self.answers)
+
+    def toDict(self) -> Dict:
+        # b64encode reads the array buffers directly, no per-entry objects
+        return {
+            "users": base64.b64encode(memoryview(self.users)).decode(),
+            "answers": base64.b64encode(memoryview(self.answers)).decode(),
+        }
+
+    @classmethod
+    def fromDict(cls, data: Dict) -> "CompactVotes":
+        res = cls()
+        res.users.frombytes(base64.b64decode(data["users"]))
+        res.answers.frombytes(base64.b64decode(data["answers"]))
+        return res
+
+
+class PollStore:
+    """Durable poll storage: append-only write-ahead log plus snapshots.
+
+    Every change (poll created, vote cast, poll closed) is appended to the log
+    as one JSON line, so the cost of a vote does not depend on how many polls
+    or voters exist. `compact` periodically folds the log into a snapshot in
+    a worker thread. Records carry a sequence number and replay skips those
+    already covered by the snapshot, so a crash at any point is safe.
+    """
+
+    def __init__(self, snapshot: Path, log: Path, fsync: bool = False):
+        self.snapshot_path = snapshot
+        self.log_path = log
+        self.fsync = fsync
+        self.seq = 0
+        self.pending = 0
+        self.compacting = False
+        self.log: Optional[IO] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.log is not None
+
+    def segments(self) -> List[Tuple[int, Path]]:
+        """Rotated log segments, oldest first."""
+        res = []
+        for path in self.log_path.parent.glob(f"{self.log_path.name}.*"):
+            suffix = path.suffix[1:]
+            if suffix.isdigit():
+                res.append((int(suffix), path))
+
+        return sorted(res)
+
+    def load(self, factory: Callable[[Dict], Any]) -> Dict[str, Any]:
+        """Read the snapshot and replay the log on top of it."""
+        polls = {}
+        snapshot_seq = 0
+
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r") as f:
+                data: Dict = json.load(f)
+
+            snapshot_seq = data.get("seq", 0)
+            for v in data["polls"]:
+                poll = factory(v)
+                polls[f"{poll.channelId}_{poll.messageId}"] = poll
+
+        self.seq = snapshot_seq
+        replayed = 0
+        for path in [p for _, p in self.segments()] + [self.log_path]:
+            if not path.exists():
+                continue
+
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping truncated record in {path}")
+                        continue
+
+                    if record["seq"] <= snapshot_seq:
+                        continue
+
+                    self.apply(polls, record, factory)
+                    self.seq = max(self.seq, record["seq"])
+                    replayed += 1
+
+        logger.info(f"Loaded {len(polls)} polls, replayed {replayed} log records")
+        self.pending = replayed
+        self.truncate_torn_tail()
+        self.log = open(self.log_path, "a")
+        return polls
+
+    def truncate_torn_tail(self):
+        """Cut a partial last record (crash mid-append) off the live log, so
+        the next record doesn't get glued onto it."""
+        if not self.log_path.exists():
+            return
+
+        with open(self.log_path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # Scan back for the last complete record
+            end = size
+            while end > 0:
+                start = max(end - 4096, 0)
+                f.seek(start)
+                chunk = f.read(end - start)
+                i = chunk.rfind(b"\n")
+                if i >= 0:
+                    end = start + i + 1
+                    break
+                end = start
+
+            logger.warning(f"Truncating torn record at the end of {self.log_path}")
+            f.truncate(end)
+
+    @staticmethod
+    def apply(polls: Dict[str, Any], record: Dict, factory: Callable[[Dict], Any]):
+        poll_id = record["id"]
+        if record["op"] == "create":
+            polls[poll_id] = factory(record["poll"])
+        elif record["op"] == "close":
+            polls.pop(poll_id, None)
+        elif record["op"] == "vote":
+            poll = polls.get(poll_id, None)
+            if poll is None:
+                return
+
+            if record["answer"] is None:
+                poll.reset(record["user"])
+            else:
+                poll.cast(record["user"], record["answer"], record.get("weight", 1))
+
+    def append(self, record: Dict):
+        self.seq += 1
+        record["seq"] = self.seq
+        self.log.write(json.dumps(record) + "\n")
+        self.log.flush()
+        if self.fsync:
+            os.fsync(self.log.fileno())
+
+        self.pending += 1
+
+    def create(self, poll_id: str, poll):
+        self.append({"op": "create", "id": poll_id, "poll": poll.toDict()})
+
+    def vote(
+        self,
+        poll_id: str,
+        user: int,
+        answer: Optional[int | Sequence[int]],
+        weight: int = 1,
+    ):
+        record = {"op": "vote", "id": poll_id, "user": user, "answer": answer}
+        if weight != 1:
+            record["weight"] = weight
+
+        self.append(record)
+
+    def close(self, poll_id: str):
+        self.append({"op": "close", "id": poll_id})
+
+    def rotate(self, polls: Dict[str, Any]) -> Dict:
+        """Capture the current state and start a fresh log segment."""
+        data = {"seq": self.seq, "polls": [p.toDict() for p in polls.values()]}
+
+        self.log.close()
+        os.replace(
+            self.log_path, self.log_path.with_name(f"{self.log_path.name}.{self.seq}")
+        )
+        self.log = open(self.log_path, "a")
+        self.pending = 0
+
+        return data
+
+    def write_snapshot(self, data: Dict):
+        tmp = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, self.snapshot_path)
+
+        for seq, path in self.segments():
+            if seq <= data["seq"]:
+                path.unlink()
+
+    async def compact(self, polls: Dict[str, Any]):
+        """Fold the log into a new snapshot without blocking the event loop."""
+        if not self.loaded or self.compacting:
+            return
+
+        self.compacting = True
+        try:
+            data = self.rotate(polls)
+            await asyncio.to_thread(self.write_snapshot, data)
+            logger.debug(f"Poll store compacted at seq {data['seq']}")
+        finally:
+            self.compacting = False
+
+    def snapshot(self, polls: Dict[str, Any]):
+        """Synchronous compaction, used on shutdown."""
+        if not self.loaded or self.compacting:
+            return
+
+        self.write_snapshot(self.rotate(polls))
@@ -1,7 +1,9 @@
+import asyncio
 import math
 import collections
 import datetime
 import json
+import os
 import re
 from dataclasses import dataclass, field
 from pathlib import Path
@@ -9,11 +11,14 @@ from typing import *
 
 import discord
 import discord.utils
+import emoji
 from dateutil import parser
 from discord import ApplicationContext, Interaction
 from discord.ext import commands, tasks
 from loguru import logger
 
+from cogs.guild_index import MemberWeights
+
 # A Python port of Ved_s' PollSystem. Thanks!
 
 PollIdValidator = re.compile("^(\d+)_(\d+)$")
@@ -123,9 +128,156 @@ def create_message(poll: Poll, ended: bool) -> Dict:
     }
 
 
+class MessageTally:
+    """Reactors of one message, per emoji. Totals are weighed on demand with
+    the current member weights, so role changes since a user reacted count."""
+
+    def __init__(self):
+        self.users: Dict[str, Set[int]] = {}
+
+    def add(self, key: str, user: int):
+        self.users.setdefault(key, set()).add(user)
+
+    def remove(self, key: str, user: int):
+        self.users.get(key, set()).discard(user)
+
+    def total(self, key: str, weights: MemberWeights) -> int:
+        return sum(weights.get(user) for user in self.users.get(key, ()))
+
+    def matches(self, reactions: List[discord.Reaction]) -> bool:
+        """Whether the cached reactor counts agree with the message."""
+        return all(len(self.users.get(str(r.emoji), ())) == r.count for r in reactions)
+
+    def toDict(self) -> Dict:
+        return {key: list(users) for key, users in self.users.items()}
+
+    @classmethod
+    def fromDict(cls, data: Dict) -> "MessageTally":
+        res = cls()
+        for key, users in data.items():
+            for user in users:
+                res.add(key, int(user))
+
+        return res
+
+
+class TallyCache:
+    """LRU cache of `MessageTally` by message id, persisted to a JSON file."""
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+        self.tallies: collections.OrderedDict[int, MessageTally] = (
+            collections.OrderedDict()
+        )
+        self.dirty = False
+
+    def get(self, message_id: int) -> Optional[MessageTally]:
+        tally = self.tallies.get(message_id, None)
+        if tally is not None:
+            self.tallies.move_to_end(message_id)
+
+        return tally
+
+    def put(self, message_id: int, tally: MessageTally):
+        self.tallies[message_id] = tally
+        self.tallies.move_to_end(message_id)
+        while len(self.tallies) > self.size:
+            self.tallies.popitem(last=False)
+
+        self.dirty = True
+
+    def load(self):
+        if not self.path.exists():
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                data: List = json.load(f)
+
+            # Stored oldest first, so replaying keeps the LRU order
+            for message_id, tally in data[-self.size :]:
+                self.tallies[message_id] = MessageTally.fromDict(tally)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # Only a cache: summaries will just fetch reactions again
+            logger.warning(f"Failed to load {self.path}, starting empty: {e}")
+            self.tallies.clear()
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump([[k, v.toDict()] for k, v in self.tallies.items()], f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+class ReactionTally:
+    """Collects the reactors of one message.
+
+    Reactions are fetched concurrently (pages of a single reaction still come
+    one after another, the API only offers a cursor). Reaction events that
+    arrive meanwhile are kept in `events` and replayed on top of the result;
+    add/remove are idempotent, so the order relative to the fetch doesn't
+    matter.
+    """
+
+    def __init__(self):
+        self.tally = MessageTally()
+        self.events: List[Tuple[str, int, bool]] = []
+        self.fetched = 0
+
+    async def count(self, reaction: discord.Reaction):
+        key = str(reaction.emoji)
+        async for user in reaction.users(limit=None):
+            self.tally.add(key, user.id)
+            self.fetched += 1
+
+    async def run(self, reactions: List[discord.Reaction]) -> MessageTally:
+        await asyncio.gather(*(self.count(r) for r in reactions))
+        for key, user, added in self.events:
+            if added:
+                self.tally.add(key, user)
+            else:
+                self.tally.remove(key, user)
+
+        return self.tally
+
+
+def is_lock(emote) -> bool:
+    return isinstance(emote, str) and emoji.demojize(emote) == ":locked:"
+
+
 class PollToolsCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.cache = TallyCache(
+            Path("poll_tallies.json"), bot.data.get("poll_tally_cache_size", 100)
+        )
+        self.cache.load()
+        # In-flight fetches by message id, shared by concurrent summaries
+        self.seeding: Dict[int, Tuple[ReactionTally, asyncio.Task]] = {}
+        self.save_cache.start()
+
+    @property
+    def weights(self) -> MemberWeights:
+        return self.bot.data["member_weights"]
+
+    async def seed(
+        self, message_id: int, counter: ReactionTally, reactions: List
+    ) -> MessageTally:
+        try:
+            tally = await counter.run(reactions)
+        finally:
+            del self.seeding[message_id]
+
+        self.cache.put(message_id, tally)
+        return tally
 
     @discord.message_command(name="Poll summary", guild_ids=[585487843510714389])
     @discord.default_permissions(
@@ -134,36 +286,73 @@ class PollToolsCog(commands.Cog):
     async def get_message_id(self, ctx: ApplicationContext, message: discord.Message):
         resp: Interaction = await ctx.send_response("Calculating...", ephemeral=True)
 
-        guild = discord.utils.find(
-            lambda g: g.id == 585487843510714389, self.bot.guilds
-        )
+        reactions = [r for r in message.reactions if not is_lock(r.emoji)]
 
-        msg = "Результаты голосования:\n"
+        tally = self.cache.get(message.id)
+        if tally is None or not tally.matches(reactions):
+            # Not tracked yet, or reactions changed while the bot was offline
+            if message.id not in self.seeding:
+                counter = ReactionTally()
+                self.seeding[message.id] = (
+                    counter,
+                    asyncio.create_task(self.seed(message.id, counter, reactions)),
+                )
 
-        for i, r in enumerate(message.reactions):
-            print(type(r.emoji), r.emoji)
-            if isinstance(r.emoji, str) and emoji.demojize(r.emoji) == ":locked:":
-                continue
+            counter, task = self.seeding[message.id]
+            expected = sum(r.count for r in reactions)
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=2.0)
+                if done:
+                    break
 
-            summ = 0
-            msg += f"* {r.emoji}: "
-            async for m in r.users():
-                # m = guild.get_member(u.id)
-                if not isinstance(m, Member):
-                    print(f"Warning: user {m.display_name} ({m.id}) is not in guild!")
-                    weight = 1
-                else:
-                    if "Сабы" in [o.name for o in m.roles]:
-                        weight = 2
-                    else:
-                        weight = 1
+                await resp.edit_original_response(
+                    content=f"Calculating... {counter.fetched}/{expected}"
+                )
 
-                summ += weight
+            tally = task.result()
 
-            msg += f"{summ}\n"
+        msg = "Результаты голосования:\n"
+        for r in reactions:
+            msg += f"* {r.emoji}: {tally.total(str(r.emoji), self.weights)}\n"
 
         await resp.edit_original_response(content=msg)
 
+    def on_reaction_event(self, message_id: int, key: str, user: int, added: bool):
+        if message_id in self.seeding:
+            self.seeding[message_id][0].events.append((key, user, added))
+            return
+
+        tally = self.cache.get(message_id)
+        if tally is None:
+            return
+
+        if added:
+            tally.add(key, user)
+        else:
+            tally.remove(key, user)
+
+        self.cache.dirty = True
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        self.on_reaction_event(
+            payload.message_id, str(payload.emoji), payload.user_id, True
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        self.on_reaction_event(
+            payload.message_id, str(payload.emoji), payload.user_id, False
+        )
+
+    @tasks.loop(minutes=5.0)
+    async def save_cache(self):
+        self.cache.save()
+
+    def cog_unload(self):
+        self.save_cache.cancel()
+        self.cache.save()
+
 
 def setup(bot):  # this is called by Pycord to setup the cog
     bot.add_cog(PollToolsCog(bot))  # add the cog to the bot
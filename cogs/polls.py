@@ -1,8 +1,13 @@
-import math
+import asyncio
+import bisect
 import collections
+import math
 import datetime
+import heapq
+import itertools
 import json
 import re
+import time
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import *
@@ -14,29 +19,203 @@ from discord import ApplicationContext, Interaction
 from discord.ext import commands, tasks
 from loguru import logger
 
+from cogs.poll_store import CompactVotes, PollStore
+
 # A Python port of Ved_s' PollSystem. Thanks!
 
 PollIdValidator = re.compile("^(\d+)_(\d+)$")
 
+# Polls switch to array-backed vote storage past this many voters
+COMPACT_VOTES_THRESHOLD = 4096
+
+
+# Ballot kinds: one answer, any number of answers, or answers in order of
+# preference (decided by instant-runoff)
+POLL_MODES = ("single", "multi", "ranked")
+
+Ballot = int | Tuple[int, ...]
+
 
 @dataclass
 class Poll:
     title: str = ""
     description: str = ""
     answers: List[str] = field(default_factory=list)
-    votes: Dict[int, int] = field(default_factory=dict)
+    votes: Dict[int, Ballot] | CompactVotes = field(default_factory=dict)
     close_on: Optional[datetime] = None
 
     channelId: int = 0
     messageId: int = 0
     userId: int = 0
 
+    mode: str = "single"
+    # Whether votes count with the voter's role weight (see MemberWeights)
+    weighted: bool = False
+    # Weight each ballot was cast with, only where it is not 1
+    weights: Dict[int, int] = field(default_factory=dict)
+
+    # Running tallies, derived from `votes` and kept in sync by cast/reset:
+    # weighted selections per answer (first preferences for ranked polls),
+    # total weight of all ballots, and weight per distinct ranked ballot
+    counts: List[int] = field(init=False, repr=False, default_factory=list)
+    total: int = field(init=False, repr=False, default=0)
+    ballots: Counter = field(
+        init=False, repr=False, default_factory=collections.Counter
+    )
+    # Static parts of the poll message, built on first render
+    template: Optional["PollTemplate"] = field(
+        init=False, repr=False, compare=False, default=None
+    )
+
+    def __post_init__(self):
+        if self.mode not in POLL_MODES:
+            raise ValueError(f"Unknown poll mode {self.mode}")
+
+        # init=False fields with a plain default are only class attributes
+        self.template = None
+        self.recount()
+
+    def tally(self, ballot: Ballot, weight: int):
+        """Adds (or, with a negative weight, removes) a ballot."""
+        if self.mode == "single":
+            self.counts[ballot] += weight
+        elif self.mode == "multi":
+            for answer in ballot:
+                self.counts[answer] += weight
+        else:
+            self.counts[ballot[0]] += weight
+            self.ballots[ballot] += weight
+            if not self.ballots[ballot]:
+                del self.ballots[ballot]
+
+        self.total += weight
+
+    def recount(self):
+        self.counts = [0] * len(self.answers)
+        self.total = 0
+        self.ballots = collections.Counter()
+        for user, ballot in self.votes.items():
+            self.tally(ballot, self.weights.get(user, 1))
+
+    def check_counts(self) -> bool:
+        """Verifies the running tallies against the raw votes map."""
+        running = self.counts, self.total, self.ballots
+        self.recount()
+        expected = self.counts, self.total, self.ballots
+        self.counts, self.total, self.ballots = running
+        return running == expected
+
+    def ballot(self, answer: int | Sequence[int]) -> Ballot:
+        """Validates an answer (or answers) and normalizes it for this mode."""
+        if self.mode == "single":
+            choices = (answer,)
+        else:
+            answer = choices = tuple(answer)
+            if not choices or len(set(choices)) != len(choices):
+                raise ValueError(f"Invalid ballot {choices} in poll {self.title}")
+
+        for choice in choices:
+            if not 0 <= choice < len(self.answers):
+                raise ValueError(f"No answer #{choice} in poll {self.title}")
+
+        return answer
+
+    def cast(self, user: int, answer: int | Sequence[int], weight: int = 1):
+        ballot = self.ballot(answer)
+        self.reset(user)
+
+        self.votes[user] = ballot
+        if weight != 1:
+            self.weights[user] = weight
+        self.tally(ballot, weight)
+
+        if (
+            self.mode == "single"
+            and not isinstance(self.votes, CompactVotes)
+            and len(self.votes) >= COMPACT_VOTES_THRESHOLD
+        ):
+            self.votes = CompactVotes(self.votes)
+
+    def reset(self, user: int) -> bool:
+        previous = self.votes.pop(user, None)
+        if previous is None:
+            return False
+
+        self.tally(previous, -self.weights.pop(user, 1))
+        return True
+
+    def runoff(self) -> List[List[int]]:
+        """Instant-runoff rounds of a ranked poll, as per-answer counts.
+
+        Each round moves every ballot to its highest-ranked answer still in
+        the race and drops the answer with the fewest votes (on a tie, the
+        one listed last), until one has a majority. Identical ballots are
+        grouped in `ballots`, so a round is linear in the number of distinct
+        ballots.
+        """
+        eliminated: Set[int] = set()
+        rounds = []
+        while True:
+            counts = [0] * len(self.answers)
+            for ballot, weight in self.ballots.items():
+                for answer in ballot:
+                    if answer not in eliminated:
+                        counts[answer] += weight
+                        break
+
+            rounds.append(counts)
+            active = [i for i in range(len(counts)) if i not in eliminated]
+            live = sum(counts)
+            if len(active) <= 1 or not live or max(counts) * 2 > live:
+                return rounds
+
+            eliminated.add(min(active, key=lambda i: (counts[i], -i)))
+
+    def results(self) -> Tuple[List[int], int]:
+        """Per-answer votes to display and the total to compare them with."""
+        if self.mode == "ranked":
+            counts = self.runoff()[-1]
+            return counts, sum(counts)
+
+        return self.counts, self.total
+
     def toJson(self):
-        return json.dumps(self, default=lambda o: o.__dict__)
+        return json.dumps(self.toDict())
+
+    def toDict(self) -> Dict:
+        res = dict(self.__dict__)
+        del res["counts"], res["total"], res["ballots"], res["template"]
+        if isinstance(self.votes, CompactVotes):
+            res["votes"] = self.votes.toDict()
+        else:
+            res["votes"] = dict(self.votes)
+        res["weights"] = dict(self.weights)
+        res["close_on"] = self.close_on.isoformat() if self.close_on else None
+        return res
+
+    @classmethod
+    def fromDict(cls, data: Dict) -> "Poll":
+        data = dict(data)
+        votes = data.get("votes", {})
+        if "users" in votes:
+            data["votes"] = CompactVotes.fromDict(votes)
+        else:
+            data["votes"] = {
+                int(k): tuple(v) if isinstance(v, list) else v
+                for k, v in votes.items()
+            }
+        data["weights"] = {int(k): v for k, v in data.get("weights", {}).items()}
+        if data.get("close_on"):
+            data["close_on"] = datetime.datetime.fromisoformat(data["close_on"])
+        else:
+            data["close_on"] = None
+
+        return cls(**data)
 
 
 PollConfig = dict[str, Poll]
 poll_config = PollConfig()
+poll_store = PollStore(Path("polls.json"), Path("polls.wal"))
 
 
 def check_channel(name):
@@ -52,10 +231,60 @@ def check_channel(name):
     return commands.check(predicate)
 
 
+POLL_PLACEHOLDERS = {
+    "single": "Выбор ответа",
+    "multi": "Выбор ответов",
+    "ranked": "Следующий ответ по предпочтению",
+}
+
+BAR_WIDTH = 20
+# Bar for every possible number of filled cells
+BARS = ["#" * i + "-" * (BAR_WIDTH - i) for i in range(BAR_WIDTH + 1)]
+
+
+class PollTemplate:
+    """Parts of a poll message that only depend on the poll's answers: field
+    names and the answer select. Only the bars change between renders.
+
+    The select has a fixed custom_id, so the view can be re-attached to the
+    poll message with `bot.add_view` after a restart; the callback finds the
+    poll from the message it was used on.
+    """
+
+    def __init__(self, poll: Poll):
+        self.names = list(poll.answers)
+
+        options: List[discord.SelectOption] = [
+            discord.SelectOption(label="Сброс голоса", value="reset")
+        ]
+        options.extend(
+            discord.SelectOption(label=answer, value=str(i))
+            for i, answer in enumerate(poll.answers)
+        )
+
+        self.view = discord.ui.View(
+            PollSelect(
+                custom_id="poll_select",
+                placeholder=POLL_PLACEHOLDERS[poll.mode],
+                options=options,
+                # Ranked ballots are built one pick at a time, in order
+                max_values=len(options) if poll.mode == "multi" else 1,
+            ),
+            timeout=None,
+        )
+
+    @classmethod
+    def get(cls, poll: Poll) -> "PollTemplate":
+        if poll.template is None:
+            poll.template = cls(poll)
+
+        return poll.template
+
+
 def create_message(poll: Poll, ended: bool) -> Dict:
     def format_bar(votes: int) -> str:
         value = (votes / total) if total > 0 else 0
-        s = "#" * int(value * barWidth) + "-" * int((1.0 - value) * barWidth)
+        s = BARS[int(value * BAR_WIDTH)]
         percent = int(math.floor(value * 100.0))
         if value == votes and value > 0:
             s = f"[{s}]"
@@ -66,43 +295,14 @@ def create_message(poll: Poll, ended: bool) -> Dict:
 
         return s
 
-    barWidth: int = 20
-
-    total = 0
-    maxvotes = None
-
-    c = collections.Counter()
-    for i in range(len(poll.answers)):
-        c[poll.answers[i]] = 0
-
-    c.update(poll.votes.values())
-
-    maxvotes = c.most_common(1)[0][1]
-    total = c.total()
-
-    if total != 0:
-        votes = [v for v in c.values()]
-    else:
-        votes = [0 for _ in poll.answers]
-
-    logger.debug(f"{votes=}")
+    template = PollTemplate.get(poll)
+    votes, total = poll.results()
 
     fields: List[discord.EmbedField] = [
-        discord.EmbedField(name=poll.answers[i], value=format_bar(votes[i]))
-        for i in range(len(poll.answers))
-    ]
-
-    options: List[discord.SelectOption] = [
-        discord.SelectOption(label="Сброс голоса", value="reset")
+        discord.EmbedField(name=name, value=format_bar(v))
+        for name, v in zip(template.names, votes)
     ]
 
-    options.extend(
-        [
-            discord.SelectOption(label=poll.answers[i], value=str(i))
-            for i in range(len(poll.answers))
-        ]
-    )
-
     return {
         "content": "Голосование завершено" if ended else "Голосование",
         "embed": discord.Embed(
@@ -111,18 +311,139 @@ def create_message(poll: Poll, ended: bool) -> Dict:
             fields=fields,
             colour=0x00AA22 if ended else 0x0022AA,
         ),
-        "view": None
-        if ended
-        else discord.ui.View(
-            PollSelect(
-                placeholder="Выбор ответа",
-                options=options,
-            ),
-            timeout=None,
-        ),
+        "view": None if ended else template.view,
     }
 
 
+class PollRenderer:
+    """Coalesces poll message edits.
+
+    Votes only mark a poll as dirty; a per-poll task performs at most one
+    ``Message.edit`` per ``interval`` seconds and always renders the current
+    tally, so a burst of votes costs a single edit.
+    """
+
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        self.dirty: Dict[str, discord.Message] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.requested = 0
+        self.edits = 0
+
+    @property
+    def saved(self) -> int:
+        return self.requested - self.edits - len(self.dirty)
+
+    def schedule(self, poll_id: str, message: discord.Message):
+        self.requested += 1
+        self.dirty[poll_id] = message
+        if poll_id not in self.tasks:
+            self.tasks[poll_id] = asyncio.create_task(self.flush(poll_id))
+
+    def cancel(self, poll_id: str):
+        self.dirty.pop(poll_id, None)
+        task = self.tasks.pop(poll_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def flush(self, poll_id: str):
+        try:
+            while poll_id in self.dirty:
+                message = self.dirty.pop(poll_id)
+                poll = poll_config.get(poll_id, None)
+                if poll is None:
+                    break
+
+                try:
+                    await message.edit(**create_message(poll, False))
+                    self.edits += 1
+                except discord.HTTPException as e:
+                    logger.warning(f"Failed to update poll {poll_id}: {e}")
+
+                await asyncio.sleep(self.interval)
+        finally:
+            self.tasks.pop(poll_id, None)
+
+        logger.debug(
+            f"Poll renderer: {self.requested} updates requested, "
+            f"{self.edits} edits sent, {self.saved} edits saved"
+        )
+
+
+poll_renderer = PollRenderer()
+
+
+class DeadlineScheduler:
+    """Closes polls exactly at their ``close_on`` time.
+
+    Deadlines live in a min-heap, so adding one is O(log n). Cancelling only
+    marks the heap entry as dead; dead entries are discarded when they reach
+    the top. The runner sleeps until the earliest deadline and is woken early
+    when a sooner one is added.
+    """
+
+    def __init__(self):
+        self.callback: Optional[Callable[[str], Awaitable]] = None
+        self.heap: List[list] = []
+        self.entries: Dict[str, list] = {}
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, poll_id: str, deadline: datetime.datetime):
+        self.cancel(poll_id)
+        if deadline.tzinfo is not None:
+            deadline = deadline.astimezone().replace(tzinfo=None)
+
+        entry = [deadline, next(self.counter), poll_id]
+        self.entries[poll_id] = entry
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.wakeup.set()
+
+    def cancel(self, poll_id: str):
+        entry = self.entries.pop(poll_id, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            while self.heap and self.heap[0][-1] is None:
+                heapq.heappop(self.heap)
+
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+
+            delay = (self.heap[0][0] - datetime.datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, poll_id = heapq.heappop(self.heap)
+            del self.entries[poll_id]
+            try:
+                await self.callback(poll_id)
+            except Exception:
+                logger.exception(f"Failed to close poll {poll_id}")
+
+
+poll_deadlines = DeadlineScheduler()
+
+
 class PollSelect(discord.ui.Select):
     def __init__(self, *args, **kwargs):
         # self.poll_id = poll_id
@@ -130,10 +451,12 @@ class PollSelect(discord.ui.Select):
 
     async def callback(self, interaction: Interaction):
         poll_id = f"{interaction.channel.id}_{interaction.message.id}"
-        logger.info(f"Casting vote: poll {poll_id}, value {self.values[0]}")
+        logger.info(f"Casting vote: poll {poll_id}, values {self.values}")
         poll = poll_config.get(poll_id, None)
         if poll is None:
-            interaction.response.send_message("Голосование не найдено", ephemeral=True)
+            await interaction.response.send_message(
+                "Голосование не найдено", ephemeral=True
+            )
             # TODO
             # msg = await interaction.original_response()
             # embeds = msg.embeds
@@ -143,19 +466,44 @@ class PollSelect(discord.ui.Select):
             # msg.edit(embeds=embeds)
             return
 
-        if self.values[0] == "reset":
-            poll.votes.pop(interaction.user.id, None)
+        user = interaction.user.id
+        if "reset" in self.values:
+            poll.reset(user)
+            poll_store.vote(poll_id, user, None)
         else:
-            poll.votes[interaction.user.id] = int(self.values[0])
+            weight = 1
+            if poll.weighted:
+                weight = interaction.client.data["member_weights"].get(user)
+
+            if poll.mode == "single":
+                ballot = int(self.values[0])
+            elif poll.mode == "multi":
+                ballot = tuple(sorted(int(v) for v in self.values))
+            else:
+                # Each pick appends to the ranking, "reset" starts over
+                ballot = poll.votes.get(user, ())
+                if int(self.values[0]) not in ballot:
+                    ballot += (int(self.values[0]),)
+
+            poll.cast(user, ballot, weight)
+            poll_store.vote(poll_id, user, ballot, weight)
 
-        msg = interaction.message
-        await msg.edit(**create_message(poll, False))
         await interaction.response.send_message("✔ Голос учтён")
+        poll_renderer.schedule(poll_id, interaction.message)
 
 
 class PollModal(discord.ui.Modal):
-    def __init__(self, channel: discord.TextChannel | None, *args, **kwargs) -> None:
+    def __init__(
+        self,
+        channel: discord.TextChannel | None,
+        *args,
+        mode: str = "single",
+        weighted: bool = False,
+        **kwargs,
+    ) -> None:
         self.channel = channel
+        self.mode = mode
+        self.weighted = weighted
         super().__init__(
             discord.ui.InputText(
                 label="Заголовок",
@@ -211,6 +559,9 @@ class PollModal(discord.ui.Modal):
             answers=self.children[2].value.splitlines(),
             close_on=close_on,
             channelId=channel_.id,
+            userId=interaction.user.id,
+            mode=self.mode,
+            weighted=self.weighted,
         )
 
         # await interaction.response.send_message(
@@ -221,56 +572,193 @@ class PollModal(discord.ui.Modal):
         msg = await channel_.send(**create_message(p, False))
         p.messageId = msg.id
         poll_config[f"{p.channelId}_{p.messageId}"] = p
+        poll_index.add(f"{p.channelId}_{p.messageId}", p)
+        poll_store.create(f"{p.channelId}_{p.messageId}", p)
+        if p.close_on:
+            poll_deadlines.add(f"{p.channelId}_{p.messageId}", p.close_on)
+
+
+class PollIndex:
+    """Lookup structures behind `/endpoll` autocomplete.
+
+    Polls are indexed by owner and by lowercase title trigrams. Queries
+    shorter than a trigram use a sorted title list for prefix matches.
+    The last few results are cached per user (a small LRU, for the
+    keystrokes of one query) and dropped whenever a poll is added or removed.
+    """
+
+    limit = 25
+    # Cached queries per user, and users with a cache
+    cache_queries = 8
+    cache_users = 64
+
+    def __init__(self):
+        self.by_owner: Dict[int, Set[str]] = collections.defaultdict(set)
+        self.trigrams: Dict[str, Set[str]] = collections.defaultdict(set)
+        self.titles: List[Tuple[str, str]] = []
+        self.cache: collections.OrderedDict[
+            int, collections.OrderedDict[Tuple[bool, str], List[str]]
+        ] = collections.OrderedDict()
+
+    @staticmethod
+    def grams(text: str) -> Set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def add(self, poll_id: str, poll: Poll):
+        title = poll.title.lower()
+        self.by_owner[poll.userId].add(poll_id)
+        for gram in self.grams(title):
+            self.trigrams[gram].add(poll_id)
+
+        bisect.insort(self.titles, (title, poll_id))
+        self.cache.clear()
+
+    def remove(self, poll_id: str, poll: Poll):
+        title = poll.title.lower()
+        self.by_owner[poll.userId].discard(poll_id)
+        for gram in self.grams(title):
+            self.trigrams[gram].discard(poll_id)
+
+        i = bisect.bisect_left(self.titles, (title, poll_id))
+        if i < len(self.titles) and self.titles[i] == (title, poll_id):
+            del self.titles[i]
+
+        self.cache.clear()
+
+    def search(self, user: int, is_mod: bool, text: str) -> List[str]:
+        text = text.strip().lower()
+        cache = self.cache.setdefault(user, collections.OrderedDict())
+        self.cache.move_to_end(user)
+        if len(self.cache) > self.cache_users:
+            self.cache.popitem(last=False)
+
+        key = (is_mod, text)
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        if not is_mod:
+            # Users only see their own polls, usually a handful
+            found = sorted(
+                (poll_config[k].title.lower(), k)
+                for k in self.by_owner.get(user, ())
+                if text in poll_config[k].title.lower()
+            )
+        elif len(text) < 3:
+            found = []
+            i = bisect.bisect_left(self.titles, (text,))
+            while len(found) < self.limit and i < len(self.titles):
+                if not self.titles[i][0].startswith(text):
+                    break
+                found.append(self.titles[i])
+                i += 1
+        else:
+            matches = sorted(
+                (self.trigrams.get(g, set()) for g in self.grams(text)), key=len
+            )
+            candidates = set.intersection(*matches)
+            found = heapq.nsmallest(
+                self.limit,
+                (
+                    (poll_config[k].title.lower(), k)
+                    for k in candidates
+                    if text in poll_config[k].title.lower()
+                ),
+            )
+
+        res = [k for _, k in found[: self.limit]]
+        cache[key] = res
+        if len(cache) > self.cache_queries:
+            cache.popitem(last=False)
+
+        return res
+
+
+poll_index = PollIndex()
 
 
 async def poll_autocomplete(ctx: discord.AutocompleteContext):
     perms = ctx.interaction.user.guild_permissions
     is_mod = perms.manage_messages
-    res = []
 
-    for k, poll in poll_config.items():
-        if poll.userId == ctx.interaction.user.id or is_mod:
-            res.append(discord.OptionChoice(name=poll.title, value=k))
-
-    return res
+    return [
+        discord.OptionChoice(name=poll_config[k].title[:100], value=k)
+        for k in poll_index.search(ctx.interaction.user.id, is_mod, ctx.value or "")
+    ]
 
 
 class PollsCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.compact_every: int = bot.data.get("poll_compact_every", 1000)
+        self.fetch_concurrency: int = bot.data.get("poll_fetch_concurrency", 10)
+        poll_renderer.interval = bot.data.get(
+            "poll_render_interval", poll_renderer.interval
+        )
+        poll_deadlines.callback = self.close_expired
 
-    @tasks.loop(minutes=5.0)
-    async def cleanup(self):
-        now = datetime.datetime.now()
-        for poll_id, poll in poll_config.items():
-            if poll.close_on is not None and poll.close_on < now:
-                logger.info(f"Closing poll {poll_id}")
-                res = PollIdValidator.match(poll_id)
-                if not res:
-                    continue
+    def forget_poll(self, poll_id: str) -> Optional[Poll]:
+        poll = poll_config.pop(poll_id, None)
+        if poll is not None:
+            poll_index.remove(poll_id, poll)
+            poll_renderer.cancel(poll_id)
+            poll_deadlines.cancel(poll_id)
+            poll_store.close(poll_id)
 
-                channel = int(res[1])
-                message = int(res[2])
+        return poll
 
-                poll_config.pop(poll_id)
+    async def fetch_poll_message(self, poll_id: str) -> discord.Message:
+        res = PollIdValidator.match(poll_id)
+        channel = int(res[1])
+        message = int(res[2])
 
-                discord_guild = self.bot.data["discord_guild"]
-                discord_channel: discord.TextChannel = discord.utils.find(
-                    lambda c: c.id == channel, discord_guild.channels
-                )
+        discord_channel: discord.TextChannel = self.bot.data["guild_index"].channel(
+            channel
+        )
 
-                discord_message: discord.Message = await discord_channel.fetch_message(
-                    message
-                )
+        return await discord_channel.fetch_message(message)
 
-                await discord_message.edit(**create_message(poll, True))
+    async def close_expired(self, poll_id: str):
+        logger.info(f"Closing poll {poll_id}")
+        poll = self.forget_poll(poll_id)
+        if poll is None:
+            return
 
-        self.save_config()
+        discord_message = await self.fetch_poll_message(poll_id)
+        await discord_message.edit(**create_message(poll, True))
+
+    @tasks.loop(minutes=1.0)
+    async def compact(self):
+        if poll_store.pending >= self.compact_every:
+            for poll_id, poll in poll_config.items():
+                if not poll.check_counts():
+                    logger.error(f"Poll {poll_id} tallies out of sync, recounting")
+                    poll.recount()
+
+            await poll_store.compact(poll_config)
 
     @discord.slash_command(description="Открыть форму создания голосования",
                            guild_ids=[585487843510714389])
     @check_channel("ботова-отладка")
-    async def poll(self, ctx: ApplicationContext):  # , channel: discord.TextChannel):
+    async def poll(
+            self,
+            ctx: ApplicationContext,
+            mode: discord.Option(
+                discord.SlashCommandOptionType.string,
+                description="Тип голосования",
+                choices=[
+                    discord.OptionChoice(name="Один ответ", value="single"),
+                    discord.OptionChoice(name="Несколько ответов", value="multi"),
+                    discord.OptionChoice(name="Рейтинг", value="ranked"),
+                ],
+                default="single",
+            ),
+            weighted: discord.Option(
+                discord.SlashCommandOptionType.boolean,
+                description="Учитывать вес ролей",
+                default=False,
+            ),
+    ):  # , channel: discord.TextChannel):
         # modal = PollModal(channel=channel)
         # await ctx.send_modal(modal)
         global poll_config
@@ -287,6 +775,9 @@ class PollsCog(commands.Cog):
             answers="1. Раз\n2. Два\n3.Три".splitlines(),
             close_on=close_on,
             channelId=channel_.id,
+            userId=ctx.author.id,
+            mode=mode,
+            weighted=weighted,
         )
 
         # await interaction.response.send_message(
@@ -299,7 +790,10 @@ class PollsCog(commands.Cog):
         msg = await channel_.send(**msg_data)
         p.messageId = msg.id
         poll_config[f"{p.channelId}_{p.messageId}"] = p
-        self.save_config()
+        poll_index.add(f"{p.channelId}_{p.messageId}", p)
+        poll_store.create(f"{p.channelId}_{p.messageId}", p)
+        if p.close_on:
+            poll_deadlines.add(f"{p.channelId}_{p.messageId}", p.close_on)
 
     @discord.slash_command(description="Завершает голосование", guild_ids=[585487843510714389])
     @check_channel("ботова-отладка")
@@ -327,10 +821,7 @@ class PollsCog(commands.Cog):
             )
             return
 
-        channel = int(res[1])
-        message = int(res[2])
-
-        poll = poll_config.get(id, None)
+        poll = self.forget_poll(id)
 
         if poll is None:
             await ctx.interaction.response.send_message(
@@ -338,14 +829,7 @@ class PollsCog(commands.Cog):
             )
             return
 
-        poll_config.pop(id)
-
-        discord_guild = self.bot.data["discord_guild"]
-        discord_channel: discord.TextChannel = discord.utils.find(
-            lambda c: c.id == channel, discord_guild.channels
-        )
-
-        discord_message: discord.Message = await discord_channel.fetch_message(message)
+        discord_message = await self.fetch_poll_message(id)
 
         if delete:
             await ctx.interaction.response.send_message(
@@ -358,45 +842,70 @@ class PollsCog(commands.Cog):
             )
             await discord_message.edit(**create_message(poll, True))
 
-        self.save_config()
-
     @commands.Cog.listener()
     async def on_message_delete(self, message: discord.Message):
         poll_id = f"{message.channel.id}_{message.id}"
         if poll_id not in poll_config:
-            logger.info(f"Poll {poll_config[poll_id].title} already deleted")
+            logger.info(f"Poll {poll_id} already deleted")
             return
 
-        poll_config.pop(poll_id)
-        self.save_config()
+        self.forget_poll(poll_id)
 
     @commands.Cog.listener()
     async def on_ready(self):
-        discord_guild = self.bot.data["discord_guild"]
-        if Path("polls.json").exists():
-            with open("polls.json", "r") as f:
-                data: Dict = json.load(f)
-
-            for v in data["polls"]:
-                channel: discord.TextChannel = discord.utils.find(
-                    lambda c: c.id == v["channelId"], discord_guild.channels
-                )
-                if not channel:
-                    continue
+        if poll_store.loaded:
+            return
+
+        guild_index = self.bot.data["guild_index"]
+
+        start = time.perf_counter()
+        polls = poll_store.load(Poll.fromDict)
+        loaded = time.perf_counter()
+
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
 
+        async def restore(poll_id: str, poll: Poll):
+            channel: discord.TextChannel = guild_index.channel(poll.channelId)
+            if not channel:
+                logger.warning(f"Channel for poll {poll_id} not found, dropping")
+                return
+
+            async with semaphore:
                 try:
-                    message = await channel.fetch_message(v["messageId"])
-                except:
-                    continue
+                    await channel.fetch_message(poll.messageId)
+                except discord.NotFound:
+                    logger.warning(f"Message for poll {poll_id} not found, dropping")
+                    return
+                except discord.HTTPException as e:
+                    # Transient failure: keep the poll rather than losing its votes
+                    logger.warning(f"Failed to restore poll {poll_id}: {e}")
+
+            # The poll is votable as soon as its own message is confirmed
+            poll_config[poll_id] = poll
+            self.bot.add_view(PollTemplate.get(poll).view, message_id=poll.messageId)
+            poll_index.add(poll_id, poll)
+            if poll.close_on:
+                poll_deadlines.add(poll_id, poll.close_on)
+
+        await asyncio.gather(*(restore(k, v) for k, v in polls.items()))
+        fetched = time.perf_counter()
+
+        logger.info(
+            f"Restored {len(poll_config)}/{len(polls)} polls: "
+            f"load {loaded - start:.3f}s, fetch {fetched - loaded:.3f}s"
+        )
+
+        if not self.compact.is_running():
+            self.compact.start()
 
-                poll_config[f"{channel.id}_{message.id}"] = Poll(**v)
+        poll_deadlines.start()
 
     def save_config(self):
-        return
-        # with open("polls.json", "w") as f:
-        #     json.dump(poll_config, f)
+        poll_store.snapshot(poll_config)
 
     def cog_unload(self):
+        self.compact.cancel()
+        poll_deadlines.stop()
         self.save_config()
 
 
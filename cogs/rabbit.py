@@ -1,70 +1,703 @@
 import asyncio
 import base64
+import bisect
+import collections
+import dataclasses
+import datetime
+import io
 import json
+import re
+import time
 from io import BytesIO
+from typing import *
 
 import discord
 from loguru import logger
 from discord.ext import commands
-from aio_pika import connect
-from aio_pika.abc import AbstractIncomingMessage
+from aio_pika import Message, connect_robust
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+from aio_pika.exceptions import AMQPConnectionError
 
 from config import *
 
+try:
+    # Installed with py-cord[speed]
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Binary message format: 4-byte big-endian header length, JSON header, then the
+# raw bytes of each attachment listed in header["attachments"]
+ENVELOPE_CONTENT_TYPE = "application/x-discord-envelope"
+
+# Delay between RabbitMQ connection attempts, doubled after each failure
+RECONNECT_DELAY_MIN = 1.0
+RECONNECT_DELAY_MAX = 60.0
+
+
+class MemoryViewIO(io.RawIOBase):
+    """Read-only file object over a memoryview.
+
+    Lets attachments sliced out of a message body be handed to `discord.File`
+    without copying them first.
+    """
+
+    def __init__(self, view: memoryview):
+        self.view = view
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(min(len(b), len(self.view) - self.pos), 0)
+        b[:n] = self.view[self.pos : self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+
+class InvalidMessage(ValueError):
+    """A message that can never be delivered: undecodable, unknown action or
+    failing its schema. It's acked (not retried) and reported as invalid."""
+
+
+def parse_envelope(body: bytes) -> Tuple[Dict, List[discord.File]]:
+    view = memoryview(body)
+    size = int.from_bytes(view[:4], "big")
+    header = json_loads(bytes(view[4 : 4 + size]))
+
+    files = []
+    offset = 4 + size
+    for attachment in header.get("attachments", []):
+        end = offset + attachment["size"]
+        if end > len(view):
+            raise ValueError("Truncated message envelope")
+
+        files.append(
+            discord.File(
+                MemoryViewIO(view[offset:end]), filename=attachment["filename"]
+            )
+        )
+        offset = end
+
+    return header, files
+
+
+@dataclasses.dataclass
+class SendMessage:
+    """Payload of the ``send`` action."""
+
+    message: str
+    channel: Optional[str] = None
+    # Legacy single attachment, base64-encoded
+    attachment: Optional[str] = None
+    filename: Optional[str] = None
+
+    def __post_init__(self):
+        if self.attachment is not None and self.filename is None:
+            raise ValueError("attachment without filename")
+
+
+def decode_message(cls: type, body: Dict):
+    """Builds the dataclass `cls` from a decoded body, checking field types.
+
+    Keys that are not fields of `cls` (e.g. ``action``) are ignored.
+    """
+    hints = get_type_hints(cls)
+    kwargs = {}
+    for f in dataclasses.fields(cls):
+        if f.name not in body:
+            if f.default is dataclasses.MISSING:
+                raise ValueError(f"missing field {f.name!r}")
+            continue
+
+        value = body[f.name]
+        expected = get_args(hints[f.name]) or (hints[f.name],)
+        if not isinstance(value, expected):
+            raise ValueError(
+                f"field {f.name!r} has type {type(value).__name__}, "
+                f"expected {hints[f.name]}"
+            )
+        kwargs[f.name] = value
+
+    return cls(**kwargs)
+
+
+class ActionStats:
+    """Counters and a latency histogram for one action."""
+
+    buckets = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.invalid = 0
+        self.histogram = [0] * len(self.buckets)
+
+    def record(self, latency: float):
+        self.count += 1
+        self.histogram[bisect.bisect_left(self.buckets, latency)] += 1
+
+    def __str__(self):
+        histogram = ", ".join(
+            f"<={b}s: {n}" for b, n in zip(self.buckets, self.histogram) if n
+        )
+        return (
+            f"{self.count} handled, {self.errors} failed, {self.invalid} invalid"
+            f" [{histogram}]"
+        )
+
+
+class RoleMentioner:
+    """Replaces ``@role name`` with role mentions in a single pass.
+
+    All names are compiled into one alternation, longest first, so a role
+    whose name is a prefix of another one can't mangle the longer mention.
+    """
+
+    def __init__(self, roles: Dict[str, discord.Role]):
+        self.mentions = {name: role.mention for name, role in roles.items()}
+        self.pattern = None
+        if self.mentions:
+            names = sorted(self.mentions, key=len, reverse=True)
+            # The literal "@" prefix lets the regex engine skip to candidates
+            self.pattern = re.compile(
+                "@(" + "|".join(re.escape(name) for name in names) + ")"
+            )
+
+    def __call__(self, text: str) -> str:
+        if self.pattern is None:
+            return text
+
+        return self.pattern.sub(lambda m: self.mentions[m[1]], text)
+
+
+class SendStats:
+    """Throughput and latency of outbound Discord posts."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.messages = 0
+        self.posts = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latencies: List[float]):
+        self.messages += len(latencies)
+        self.posts += 1
+        self.latency_total += sum(latencies)
+        self.latency_max = max(self.latency_max, *latencies)
+
+    @property
+    def throughput(self) -> float:
+        """Messages per second since startup."""
+        return self.messages / max(time.monotonic() - self.started, 1e-9)
+
+    @property
+    def latency_avg(self) -> float:
+        return self.latency_total / self.messages if self.messages else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.messages} messages in {self.posts} posts, "
+            f"{self.throughput:.2f} msg/s, latency avg {self.latency_avg:.3f}s "
+            f"max {self.latency_max:.3f}s"
+        )
+
+
+class ChannelQueue:
+    """Outbound queue for one Discord channel.
+
+    Consecutive text-only messages that arrive within `window` seconds of the
+    first one are merged into a single post of up to 2000 characters. A
+    message with an attachment ends the batch and is posted on its own, so
+    the original order is kept.
+    """
+
+    limit = 2000
+
+    def __init__(self, cog: "RabbitCog", channel: discord.TextChannel, window: float):
+        self.cog = cog
+        self.channel = channel
+        self.window = window
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.carry = None
+        self.task = asyncio.create_task(self.run())
+
+    async def put(self, content: str, files: List[discord.File]) -> discord.Message:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self.queue.put((content, files, future, loop.time()))
+        return await future
+
+    async def next_item(self, timeout: Optional[float] = None):
+        if self.carry is not None:
+            item, self.carry = self.carry, None
+            return item
+
+        if timeout is None:
+            return await self.queue.get()
+
+        return await asyncio.wait_for(self.queue.get(), max(timeout, 0))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.next_item()]
+            content, files = batch[0][0], batch[0][1]
+
+            if not files:
+                deadline = loop.time() + self.window
+                while True:
+                    try:
+                        item = await self.next_item(deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+
+                    text, attachments = item[0], item[1]
+                    too_long = len(content) + 1 + len(text) > self.limit
+                    if attachments or too_long:
+                        self.carry = item
+                        break
+
+                    content += "\n" + text
+                    batch.append(item)
+
+            try:
+                result = await self.cog.deliver(
+                    self.channel, content=content, files=files
+                )
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = loop.time()
+            self.cog.stats.record([now - queued for _, _, _, queued in batch])
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_result(result)
+
+            logger.debug(f"Channel {self.channel.name}: {self.cog.stats}")
+
+
+class ReplyPublisher:
+    """Publishes delivery reports to the producer's ``reply_to`` queue.
+
+    The channel runs in publisher confirm mode. Replies are collected for up
+    to `window` seconds (or until `batch_size` are pending) and published
+    together, and the broker confirms for the whole batch are awaited at
+    once instead of one round-trip per reply.
+    """
+
+    def __init__(
+        self, channel: AbstractChannel, window: float = 0.05, batch_size: int = 100
+    ):
+        self.channel = channel
+        self.window = window
+        self.batch_size = batch_size
+        self.pending: List[Tuple[str, Message]] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.failed = 0
+
+    def publish(self, reply_to: str, correlation_id: Optional[str], payload: Dict):
+        message = Message(
+            body=json.dumps(payload).encode(),
+            content_type="application/json",
+            correlation_id=correlation_id,
+        )
+        self.pending.append((reply_to, message))
+
+        if len(self.pending) >= self.batch_size:
+            asyncio.create_task(self.flush())
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.window)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        exchange = self.channel.default_exchange
+        results = await asyncio.gather(
+            *(exchange.publish(m, routing_key=reply_to) for reply_to, m in batch),
+            return_exceptions=True,
+        )
+
+        failed = [r for r in results if isinstance(r, Exception)]
+        self.published += len(batch) - len(failed)
+        self.failed += len(failed)
+        if failed:
+            logger.warning(
+                f"{len(failed)} of {len(batch)} replies not confirmed: {failed[0]}"
+            )
+
 
 class RabbitCog(commands.Cog, name="Rabbit"):
     def __init__(self, bot):
         self.bot = bot
         self.rabbit = None
-        asyncio.ensure_future(self.setup())
+        self.prefetch: int = bot.data.get("rabbit_prefetch", 10)
+        self.workers = asyncio.Semaphore(bot.data.get("rabbit_workers", 10))
+        self.batch_window: float = bot.data.get("rabbit_batch_window", 0.5)
+        self.channel_queues: Dict[int, ChannelQueue] = {}
+        self.stats = SendStats()
+        self.mentioner: Optional[RoleMentioner] = None
+        self.max_retries = 5
+        # Loop time until which Discord told us to back off
+        self.rate_limited_until = 0.0
+        self.actions: Dict[str, Tuple[Callable[..., Awaitable], Optional[type]]] = {}
+        self.action_stats: Dict[str, ActionStats] = collections.defaultdict(
+            ActionStats
+        )
+        self.register_action("send", self.send, SendMessage)
+
+        self.setup_lock = asyncio.Lock()
+        self.rabbit_queue = None
+        self.consumer_tag = None
+        self.inflight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        # Connection health, see on_connection_lost / on_reconnect
+        self.reconnects = 0
+        self.disconnected_at: Optional[float] = None
+        self.last_message_at: Optional[float] = None
+        self.gap_started_at: Optional[float] = None
+        self.last_reconnect_time = 0.0
+        self.last_message_gap = 0.0
+        self.backoff_task: Optional[asyncio.Task] = None
+        self.replies: Optional[ReplyPublisher] = None
+
+    def register_action(
+        self,
+        name: str,
+        handler: Callable[[Any, List[discord.File]], Awaitable],
+        schema: Optional[type] = None,
+    ):
+        """Routes messages with ``"action": name`` to `handler`.
+
+        If `schema` (a dataclass) is given, the body is validated and decoded
+        into it before the handler is called; otherwise the handler gets the
+        raw dict.
+        """
+        self.actions[name] = (handler, schema)
+
+    async def dispatch(self, body: Dict, files: List[discord.File]) -> Any:
+        name = body.get("action", None) if isinstance(body, dict) else None
+        logger.debug(f"Action is: {name}")
+
+        if name not in self.actions:
+            logger.warning(f"Unknown action {name!r}, dropping message")
+            self.action_stats["<unknown>"].invalid += 1
+            raise InvalidMessage(f"unknown action {name!r}")
+
+        handler, schema = self.actions[name]
+        stats = self.action_stats[name]
+
+        if schema is not None:
+            try:
+                body = decode_message(schema, body)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Invalid {name} message, dropping: {e}")
+                stats.invalid += 1
+                raise InvalidMessage(f"invalid {name} message: {e}") from e
+
+        start = time.perf_counter()
+        try:
+            return await handler(body, files)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.record(time.perf_counter() - start)
+            logger.debug(f"Action {name}: {stats}")
 
     async def setup(self):
-        self.rabbit = await connect(self.bot.data["rabbit_url"])
-        rabbit_channel = await self.rabbit.channel()
-        rabbit_queue = await rabbit_channel.declare_queue(name="discord")
-        await rabbit_queue.consume(self.on_rabbit_message)
+        """Connects and starts consuming. Safe to call more than once."""
+        async with self.setup_lock:
+            if self.rabbit is not None:
+                return
+
+            delay = RECONNECT_DELAY_MIN
+            while True:
+                try:
+                    # A robust connection reconnects by itself and restores its
+                    # channels, QoS, queues and consumers afterwards
+                    rabbit = await connect_robust(
+                        self.bot.data["rabbit_url"],
+                        reconnect_interval=RECONNECT_DELAY_MIN,
+                    )
+                    break
+                except (AMQPConnectionError, OSError) as e:
+                    logger.warning(
+                        f"RabbitMQ connection failed ({e}), retrying in {delay:.0f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+            rabbit.close_callbacks.add(self.on_connection_lost)
+            rabbit.reconnect_callbacks.add(self.on_reconnect)
+
+            rabbit_channel = await rabbit.channel()
+            # Unacked messages stay with the broker, so prefetch bounds memory use
+            await rabbit_channel.set_qos(prefetch_count=self.prefetch)
+            self.rabbit_queue = await rabbit_channel.declare_queue(name="discord")
+            self.consumer_tag = await self.rabbit_queue.consume(self.on_rabbit_message)
+
+            reply_channel = await rabbit.channel(publisher_confirms=True)
+            self.replies = ReplyPublisher(reply_channel)
+            self.rabbit = rabbit
+            logger.info("Connected to RabbitMQ")
+
+    def on_connection_lost(self, *args):
+        loop = asyncio.get_running_loop()
+        if self.disconnected_at is None:
+            self.disconnected_at = loop.time()
+            self.gap_started_at = self.last_message_at
+            if self.backoff_task is None or self.backoff_task.done():
+                self.backoff_task = asyncio.create_task(self.reconnect_backoff())
+        logger.warning("RabbitMQ connection lost")
+
+    async def reconnect_backoff(self):
+        """Grows the robust connection's retry interval while disconnected.
+
+        aio-pika retries at a fixed `reconnect_interval`, re-reading it before
+        every wait, so doubling it in step with the attempts gives exponential
+        back-off. It's reset once `on_reconnect` runs.
+        """
+        delay = RECONNECT_DELAY_MIN
+        while self.disconnected_at is not None and self.rabbit is not None:
+            self.rabbit.reconnect_interval = delay
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    def on_reconnect(self, *args):
+        loop = asyncio.get_running_loop()
+        self.reconnects += 1
+        if self.disconnected_at is not None:
+            self.last_reconnect_time = loop.time() - self.disconnected_at
+            self.disconnected_at = None
+
+        if self.rabbit is not None:
+            self.rabbit.reconnect_interval = RECONNECT_DELAY_MIN
+
+        logger.info(
+            f"RabbitMQ reconnected after {self.last_reconnect_time:.1f}s "
+            f"({self.reconnects} reconnects so far)"
+        )
 
     async def on_rabbit_message(self, message: AbstractIncomingMessage) -> None:
         logger.debug("RabbitMQ message received!")
-        async with message.process():
-            body_ = message.body
-            body = json.loads(body_)
-            logger.debug("Action is: %s", body["action"])
-            if body["action"] == "send":
-                self.send(body)
-
-    def send(self, body):
-        logger.info("Received send command")
-        discord_channel = globals().get("discord_channel")
 
-        if "attachment" in body:
-            attachment_data = base64.b64decode(body["attachment"])
-            att_io = discord.File(BytesIO(attachment_data), filename=body["filename"])
+        now = asyncio.get_running_loop().time()
+        if self.gap_started_at is not None:
+            self.last_message_gap = now - self.gap_started_at
+            self.gap_started_at = None
+            logger.info(
+                f"First message after reconnect, gap {self.last_message_gap:.1f}s"
+            )
+        self.last_message_at = now
+
+        self.inflight += 1
+        self.idle.clear()
+        try:
+            async with self.workers:
+                # The message is acked only after it was delivered to Discord.
+                # Failures are requeued once, then dropped.
+                async with message.process(requeue=True, reject_on_redelivered=True):
+                    try:
+                        body, files = self.decode(message)
+                        result = await self.dispatch(body, files)
+                    except InvalidMessage as e:
+                        # Retrying won't help; ack it and tell the producer
+                        self.reply(message, {"status": "invalid", "error": str(e)})
+                        return
+                    except Exception as e:
+                        # Only report failures that won't be retried
+                        if message.redelivered:
+                            self.reply(message, {"status": "error", "error": str(e)})
+                        raise
+
+                    self.reply(
+                        message,
+                        {
+                            "status": "ok",
+                            "message_id": getattr(result, "id", None),
+                        },
+                    )
+        finally:
+            self.inflight -= 1
+            if self.inflight == 0:
+                self.idle.set()
+
+    @staticmethod
+    def decode(message: AbstractIncomingMessage) -> Tuple[Any, List[discord.File]]:
+        try:
+            if message.content_type == ENVELOPE_CONTENT_TYPE:
+                return parse_envelope(message.body)
+
+            return json_loads(message.body), []
+        except (ValueError, TypeError, KeyError) as e:
+            # json and orjson decode errors are ValueErrors
+            logger.error(f"Undecodable RabbitMQ message, dropping: {e}")
+            raise InvalidMessage(f"undecodable message: {e}") from e
+
+    def reply(self, message: AbstractIncomingMessage, payload: Dict):
+        """Reports the outcome of `message` if the producer asked for it."""
+        if not message.reply_to or self.replies is None:
+            return
+
+        # AMQP timestamps have one second resolution; producers that want
+        # better can set a "sent_at" header with a float UNIX time
+        sent_at = (message.headers or {}).get("sent_at", None)
+        if sent_at is not None:
+            payload["latency"] = time.time() - float(sent_at)
+        elif message.timestamp is not None:
+            sent = message.timestamp
+            if sent.tzinfo is None:
+                sent = sent.replace(tzinfo=datetime.timezone.utc)
+            payload["latency"] = time.time() - sent.timestamp()
         else:
-            att_io = None
+            payload["latency"] = None
 
-        message = body["message"]
-        for role_name, role in self.bot.data["discord_roles"].items():
-            message = message.replace(f"@{role_name}", role.mention)
+        self.replies.publish(message.reply_to, message.correlation_id, payload)
 
-        channel_name = body.get("channel", discord_channel_name)
-        if channel_name != discord_channel_name:
-            discord_channel = discord.utils.find(
-                lambda c: c.name == channel_name,
-                self.bot.data["discord_guild"].channels,
-            )
-            if discord_channel is None:
-                raise RuntimeError(
-                    f"Failed to join Discord channel {discord_channel_name}!"
+    async def deliver(self, channel: discord.TextChannel, **kwargs) -> discord.Message:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries):
+            delay = self.rate_limited_until - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            for file in kwargs.get("files", None) or ():
+                file.reset()
+
+            try:
+                return await channel.send(**kwargs)
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    raise
+
+                retry_after = e.response.headers.get("Retry-After", None)
+                delay = float(retry_after) if retry_after else 2.0**attempt
+                logger.warning(
+                    f"Discord returned {e.status}, pausing sends for {delay:.1f}s"
+                )
+                self.rate_limited_until = max(
+                    self.rate_limited_until, loop.time() + delay
                 )
 
+        raise RuntimeError(f"Failed to send message after {self.max_retries} attempts")
+
+    async def send(self, body: SendMessage, files: List[discord.File]):
+        logger.info("Received send command")
+
+        if body.attachment is not None:
+            # Legacy format: a single base64-encoded attachment inside the JSON
+            attachment_data = base64.b64decode(body.attachment)
+            files = [
+                discord.File(BytesIO(attachment_data), filename=body.filename),
+                *files,
+            ]
+
+        if self.mentioner is None:
+            self.mentioner = RoleMentioner(self.bot.data["discord_roles"])
+
+        message = self.mentioner(body.message)
+
+        channel_name = body.channel or discord_channel_name
+        discord_channel = self.bot.data["guild_index"].channel(channel_name)
+        if discord_channel is None:
+            raise RuntimeError(f"Failed to join Discord channel {channel_name}!")
+
+        queue = self.channel_queues.get(discord_channel.id, None)
+        if queue is None:
+            queue = ChannelQueue(self, discord_channel, self.batch_window)
+            self.channel_queues[discord_channel.id] = queue
+
         logger.debug("Ready to send...")
-        asyncio.ensure_future(discord_channel.send(content=message, file=att_io))
+        result = await queue.put(message, files)
         logger.debug("... done")
+        return result
+
+    def refresh_roles(self):
+        guild_index = self.bot.data["guild_index"]
+        discord_roles = {}
+        for role_name in discord_role_names:
+            role = guild_index.role(role_name)
+            if role is None:
+                logger.warning(f"Role {role_name} not found!")
+            else:
+                discord_roles[role_name] = role
+
+        self.bot.data["discord_roles"] = discord_roles
+        # Rebuilt lazily on the next message
+        self.mentioner = None
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self.refresh_roles()
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.refresh_roles()
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.refresh_roles()
+
+    async def close(self, timeout: float = 30.0):
+        """Stops consuming, lets in-flight messages finish, then disconnects."""
+        if self.rabbit is None:
+            return
+
+        if self.consumer_tag is not None:
+            await self.rabbit_queue.cancel(self.consumer_tag)
+
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"{self.inflight} RabbitMQ messages still in flight, "
+                "they will be redelivered"
+            )
+
+        for queue in self.channel_queues.values():
+            queue.task.cancel()
+
+        await self.replies.flush()
+        await self.rabbit.close()
+        self.rabbit = None
+        if self.backoff_task is not None:
+            self.backoff_task.cancel()
 
     def cog_unload(self):
-        loop = asyncio.get_running_loop()
-        loop.run_until_complete(self.rabbit.close())
+        # cog_unload is synchronous and runs inside the event loop
+        asyncio.ensure_future(self.close())
 
 
 def setup(bot):  # this is called by Pycord to setup the cog
@@ -1,7 +1,8 @@
+import asyncio
 import emoji
 import copy
 import itertools
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 import discord
 from discord.ext import commands
@@ -10,15 +11,89 @@ from loguru import logger
 from config import roles
 
 
+class RoleUpdateBatcher:
+    """Coalesces role toggles per member.
+
+    Clicks made within `window` seconds are folded into one wanted state per
+    role and applied with a single member edit, instead of one add/remove
+    call per click. The last click of a batch gets the final confirmation.
+    """
+
+    def __init__(self, window: float = 1.5):
+        self.window = window
+        # member id -> role id -> whether the member should have the role
+        self.pending: Dict[int, Dict[int, bool]] = {}
+        self.interactions: Dict[int, discord.Interaction] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def toggle(
+        self,
+        member: discord.Member,
+        role: discord.Role,
+        interaction: discord.Interaction,
+    ) -> bool:
+        """Queues a toggle of `role` and returns whether it will be given."""
+        changes = self.pending.setdefault(member.id, {})
+        wanted = not changes.get(role.id, role in member.roles)
+        changes[role.id] = wanted
+        self.interactions[member.id] = interaction
+
+        if member.id not in self.tasks:
+            self.tasks[member.id] = asyncio.create_task(self.apply(member))
+
+        return wanted
+
+    async def apply(self, member: discord.Member):
+        try:
+            while member.id in self.pending:
+                await asyncio.sleep(self.window)
+                changes = self.pending.pop(member.id)
+                interaction = self.interactions.pop(member.id)
+
+                guild = member.guild
+                member = guild.get_member(member.id) or member
+                current = {r.id for r in member.roles if not r.is_default()}
+                wanted = {k for k, v in changes.items() if v}
+                final = (current - set(changes)) | wanted
+
+                removed = (set(changes) - wanted) & current
+                given = [r for k in wanted - current if (r := guild.get_role(k))]
+                taken = [r for k in removed if (r := guild.get_role(k))]
+
+                try:
+                    if final != current:
+                        await member.edit(
+                            roles=[r for k in final if (r := guild.get_role(k))],
+                            reason="Меню ролей",
+                        )
+                except discord.HTTPException as e:
+                    logger.warning(f"Failed to update roles of {member}: {e}")
+                    text = "⚠ Не удалось изменить роли, попробуйте ещё раз"
+                else:
+                    text = "✔ Роли обновлены"
+                    if given:
+                        text += "\n🎉 Выданы: " + ", ".join(r.mention for r in given)
+                    if taken:
+                        text += "\n❌ Убраны: " + ", ".join(r.mention for r in taken)
+
+                await interaction.followup.send(text, ephemeral=True)
+        finally:
+            self.tasks.pop(member.id, None)
+
+
 class RoleButton(discord.ui.Button):
-    def __init__(self, role: discord.Role, emote: str):
-        """A button for one role. `custom_id` is needed for persistent views."""
+    def __init__(self, role_id: int, emote: str, batcher: RoleUpdateBatcher):
+        """A button for one role. `custom_id` is needed for persistent views.
+
+        `emote` must already be emojized.
+        """
         super().__init__(
             # label=role.name,
             style=discord.ButtonStyle.primary,
-            emoji=emoji.emojize(emote, language="alias"),
-            custom_id=str(role.id),
+            emoji=emote,
+            custom_id=str(role_id),
         )
+        self.batcher = batcher
 
     async def callback(self, interaction: discord.Interaction):
         """
@@ -38,20 +113,16 @@ class RoleButton(discord.ui.Button):
             # Error handling could be done here.
             return
 
-        # Add the role and send a response to the user ephemerally (hidden to other
-        # users).
-        if role not in user.roles:
-            # Give the user the role if they don't already have it.
-            await user.add_roles(role)
+        # Queue the change and acknowledge it ephemerally (hidden to other
+        # users); the batcher confirms once the member is actually updated.
+        if self.batcher.toggle(user, role, interaction):
             await interaction.response.send_message(
-                f"🎉 Роль {role.mention} выдана!",
+                f"🎉 Роль {role.mention} будет выдана",
                 ephemeral=True,
             )
         else:
-            # Otherwise, take the role away from the user.
-            await user.remove_roles(role)
             await interaction.response.send_message(
-                f"❌ Роль {role.mention} убрана!",
+                f"❌ Роль {role.mention} будет убрана",
                 ephemeral=True,
             )
 
@@ -61,10 +132,39 @@ class RolesCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.roles: List[Dict[str, str]] = roles
+        self.roles: List[Dict[str, str]] = []
         self.guild = None
+        # Menu view and text, built once and reused until roles change
+        self.menu_cache: Optional[Tuple[discord.ui.View, str]] = None
+        self.batcher = RoleUpdateBatcher(bot.data.get("role_update_window", 1.5))
+
+    def resolve_roles(self):
+        guild_index = self.bot.data["guild_index"]
+        self.roles = []
+        for role in copy.deepcopy(roles):
+            role_id = guild_index.role(role["role"])
+            if role_id is None:
+                logger.warning(f"Role {role['role']} not found!")
+                continue
+
+            role["id"] = str(role_id.id)
+            role["emote"] = emoji.emojize(role["emote"], language="alias")
+            self.roles.append(role)
+
+    def build_view(self) -> Tuple[discord.ui.View, str]:
+        if self.menu_cache is None:
+            self.menu_cache = self._build_view()
+            # Persistent view: one registration serves every menu message
+            self.bot.add_view(self.menu_cache[0])
+
+        return self.menu_cache
 
-    def build_view(self) -> (discord.ui.View, str):
+    def invalidate_menu(self):
+        self.menu_cache = None
+        self.resolve_roles()
+        self.build_view()
+
+    def _build_view(self) -> Tuple[discord.ui.View, str]:
         msg_txt_1 = (
             f"""Приветствую тебя в Паучьем Логове!"""
             """Нажми на кнопку с соответствующим смайликом, если ..."""
@@ -77,7 +177,7 @@ class RolesCog(commands.Cog):
         msg_txt_1l = [msg_txt_1]
         msg_txt_2l = [msg_txt_2]
         for role in self.roles:
-            emote = emoji.emojize(role["emote"], language="alias")
+            emote = role["emote"]
             if role["type"] == "channel":
                 msg_txt_1l.append(emote + " - " + role["description"])
             elif role["type"] == "mention":
@@ -92,9 +192,7 @@ class RolesCog(commands.Cog):
 
         # Loop through the list of roles and add a new button to the view for each role.
         for r in self.roles:
-            # Get the role from the guild by ID.
-            role = self.guild.get_role(int(r["id"]))
-            view.add_item(RoleButton(role, r["emote"]))
+            view.add_item(RoleButton(int(r["id"]), r["emote"], self.batcher))
 
         return view, msg_txt
 
@@ -116,22 +214,34 @@ class RolesCog(commands.Cog):
         it will be loaded and the bot will start watching for button clicks again.
         """
         # Add the view to the bot so that it will watch for button interactions.
+        # On reconnects the cached view is already registered.
         self.guild: discord.Guild = self.bot.data["discord_guild"]
+        if self.menu_cache is None:
+            self.resolve_roles()
+            self.build_view()
+
+    def is_menu_role(self, role: discord.Role) -> bool:
+        return any(
+            r["role"] == role.name or r.get("id", None) == str(role.id)
+            for r in itertools.chain(roles, self.roles)
+        )
 
-        for i, role in enumerate(copy.deepcopy(roles)):
-            role_id = discord.utils.find(
-                lambda x: x.name == role["role"], self.guild.roles
-            )
-            if role_id is None:
-                logger.warning(f"Role {role['role']} not found!")
-                roles.pop(i)
-                continue
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        if self.menu_cache is not None and self.is_menu_role(role):
+            self.invalidate_menu()
 
-            role["id"] = str(role_id.id)
-            self.roles[i] = role
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if self.menu_cache is not None and self.is_menu_role(role):
+            self.invalidate_menu()
 
-        view, _ = self.build_view()
-        self.bot.add_view(view)
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if self.menu_cache is not None and (
+            self.is_menu_role(before) or self.is_menu_role(after)
+        ):
+            self.invalidate_menu()
 
 
 def setup(bot):  # this is called by Pycord to setup the cog
@@ -0,0 +1,12 @@
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# config.py holds deployment secrets and is not part of the repository
+if "config" not in sys.modules:
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        sys.modules["config"] = types.ModuleType("config")
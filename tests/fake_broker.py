@@ -0,0 +1,80 @@
+"""In-process stand-in for RabbitMQ, enough for the bot's consumer and reply
+publisher: a default exchange that routes by queue name, and incoming
+messages that record how they were settled."""
+
+import asyncio
+import contextlib
+import datetime
+import json
+from typing import *
+
+from aio_pika import Message
+
+
+class FakeBroker:
+    def __init__(self):
+        self.queues: Dict[str, List[Message]] = {}
+        # Set to make every publish fail its confirm
+        self.nack_all = False
+
+    def channel(self) -> "FakeChannel":
+        return FakeChannel(self)
+
+    def replies(self, queue: str) -> List[Dict]:
+        return [json.loads(m.body) for m in self.queues.get(queue, [])]
+
+
+class FakeExchange:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.publishes = 0
+
+    async def publish(self, message: Message, routing_key: str):
+        self.publishes += 1
+        # Yield like a real confirm round-trip would
+        await asyncio.sleep(0)
+        if self.broker.nack_all:
+            raise RuntimeError("publish not confirmed")
+
+        self.broker.queues.setdefault(routing_key, []).append(message)
+
+
+class FakeChannel:
+    def __init__(self, broker: FakeBroker):
+        self.default_exchange = FakeExchange(broker)
+
+
+class FakeIncomingMessage:
+    def __init__(
+        self,
+        body: bytes | Dict,
+        reply_to: Optional[str] = None,
+        correlation_id: Optional[str] = None,
+        content_type: str = "application/json",
+        headers: Optional[Dict] = None,
+        redelivered: bool = False,
+    ):
+        self.body = json.dumps(body).encode() if isinstance(body, dict) else body
+        self.reply_to = reply_to
+        self.correlation_id = correlation_id
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.timestamp = datetime.datetime.now(datetime.timezone.utc)
+        self.redelivered = redelivered
+        # "ack", "requeue" or "reject" once processed
+        self.outcome: Optional[str] = None
+
+    @contextlib.asynccontextmanager
+    async def process(self, requeue: bool = False, reject_on_redelivered: bool = False):
+        # Mirrors aio_pika's ProcessContext: ack on success, otherwise
+        # reject (requeueing unless already redelivered) and re-raise
+        try:
+            yield
+        except BaseException:
+            if requeue and not (reject_on_redelivered and self.redelivered):
+                self.outcome = "requeue"
+            else:
+                self.outcome = "reject"
+            raise
+        else:
+            self.outcome = "ack"
@@ -0,0 +1,58 @@
+import collections
+import itertools
+
+import pytest
+
+from cogs.dice_stats import Dist, distribution, keep_highest, keep_lowest, sum_dice
+
+
+def brute_force(count: int, sides: int, kept=lambda dice: dice) -> Dist:
+    totals = collections.Counter(
+        sum(kept(sorted(dice)))
+        for dice in itertools.product(range(1, sides + 1), repeat=count)
+    )
+    lo = min(totals)
+    return Dist(lo, tuple(totals[v] for v in range(lo, max(totals) + 1)))
+
+
+@pytest.mark.parametrize("count, sides", [(1, 6), (3, 6), (4, 5), (2, 20)])
+def test_sum_dice(count, sides):
+    assert sum_dice(count, sides) == brute_force(count, sides)
+
+
+@pytest.mark.parametrize(
+    "count, sides, keep", [(4, 6, 3), (5, 4, 2), (3, 5, 1), (4, 3, 4), (3, 6, 0)]
+)
+def test_keep_highest(count, sides, keep):
+    expected = brute_force(count, sides, lambda dice: dice[len(dice) - keep :])
+    assert keep_highest(count, sides, keep) == expected
+
+
+@pytest.mark.parametrize(
+    "count, sides, keep", [(3, 5, 1), (4, 6, 3), (5, 4, 2), (2, 20, 1)]
+)
+def test_keep_lowest(count, sides, keep):
+    expected = brute_force(count, sides, lambda dice: dice[:keep])
+    assert keep_lowest(count, sides, keep) == expected
+
+
+def test_distribution_combines_terms():
+    # 2d6 - 1d4 + 3, by enumerating all three dice
+    totals = collections.Counter(
+        a + b - c + 3
+        for a, b in itertools.product(range(1, 7), repeat=2)
+        for c in range(1, 5)
+    )
+    dist = distribution("2d6 - 1d4 + 3")
+    assert dist.lo == min(totals)
+    assert dist.counts == tuple(
+        totals[v] for v in range(dist.lo, dist.lo + len(dist.counts))
+    )
+
+
+@pytest.mark.parametrize(
+    "expr", ["100d1000", "50d1000+50d1000", "200d20kh100", "501d6", "1d1001", "2x"]
+)
+def test_rejected(expr):
+    with pytest.raises(ValueError):
+        distribution(expr)
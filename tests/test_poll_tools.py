@@ -0,0 +1,31 @@
+import pytest
+
+from cogs.poll_tools import MessageTally, TallyCache
+
+
+@pytest.mark.parametrize("content", ["", "[[1, {", "{}", "[[1, 2]]"])
+def test_broken_cache_file_starts_empty(tmp_path, content):
+    path = tmp_path / "poll_tallies.json"
+    path.write_text(content)
+
+    cache = TallyCache(path, 10)
+    cache.load()
+
+    assert len(cache.tallies) == 0
+
+
+def test_cache_round_trip_keeps_lru_order(tmp_path):
+    path = tmp_path / "poll_tallies.json"
+    cache = TallyCache(path, 2)
+    for message_id in (1, 2, 3):
+        tally = MessageTally()
+        tally.add("👍", message_id)
+        cache.put(message_id, tally)
+    cache.get(2)
+    cache.save()
+
+    loaded = TallyCache(path, 2)
+    loaded.load()
+
+    assert list(loaded.tallies) == [3, 2]
+    assert loaded.tallies[2].users == {"👍": {2}}
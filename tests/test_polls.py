@@ -0,0 +1,77 @@
+import asyncio
+import json
+from unittest import mock
+
+from cogs.poll_store import PollStore
+from cogs.polls import Poll, PollIndex, create_message, poll_config
+
+
+def round_trip(poll: Poll) -> Poll:
+    return Poll.fromDict(json.loads(json.dumps(poll.toDict())))
+
+
+def test_unrendered_poll_round_trips():
+    poll = Poll(answers=["a", "b", "c"], mode="ranked", weighted=True, messageId=1)
+    poll.cast(1, (1, 0), 2)
+    poll.cast(2, (2,))
+
+    restored = round_trip(poll)
+
+    assert restored.votes == {1: (1, 0), 2: (2,)}
+    assert restored.weights == {1: 2}
+    assert restored.runoff() == poll.runoff()
+    assert restored.check_counts()
+
+
+def test_to_json_of_rendered_ranked_poll():
+    poll = Poll(answers=["a", "b"], mode="ranked", messageId=1)
+    poll.cast(1, (1, 0))
+
+    async def render():
+        # Views need a running event loop
+        create_message(poll, False)
+
+    asyncio.run(render())
+    data = json.loads(poll.toJson())
+
+    assert data["votes"] == {"1": [1, 0]}
+    assert "ballots" not in data and "template" not in data
+
+
+def test_snapshot_of_loaded_polls(tmp_path):
+    store = PollStore(tmp_path / "polls.json", tmp_path / "polls.wal")
+    store.load(Poll.fromDict)
+    poll = Poll(answers=["a", "b"], mode="multi", channelId=1, messageId=2)
+    store.create("1_2", poll)
+    store.vote("1_2", 5, (0, 1))
+    store.log.close()
+
+    store = PollStore(tmp_path / "polls.json", tmp_path / "polls.wal")
+    polls = store.load(Poll.fromDict)
+    store.snapshot(polls)
+    store.log.close()
+
+    polls = PollStore(tmp_path / "polls.json", tmp_path / "polls.wal").load(
+        Poll.fromDict
+    )
+    assert polls["1_2"].counts == [1, 1]
+
+
+def test_autocomplete_cache_is_bounded():
+    index = PollIndex()
+    config = {}
+    for i in range(30):
+        poll = Poll(title=f"Опрос {i}", answers=["a"], userId=1, messageId=i)
+        config[f"1_{i}"] = poll
+        index.add(f"1_{i}", poll)
+
+    with mock.patch.dict(poll_config, config):
+        for user in range(index.cache_users * 2):
+            for n in range(1, 12):
+                index.search(user, True, "опрос 1"[:n])
+
+        expected = ["1_2"] + [f"1_{i}" for i in range(20, 30)]
+        assert index.search(0, True, "прос 2") == expected
+
+    assert len(index.cache) <= index.cache_users
+    assert all(len(c) <= index.cache_queries for c in index.cache.values())
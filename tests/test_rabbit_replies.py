@@ -0,0 +1,174 @@
+import asyncio
+import types
+
+import pytest
+
+from cogs.rabbit import RabbitCog, ReplyPublisher
+from fake_broker import FakeBroker, FakeIncomingMessage
+
+
+def make_cog(broker: FakeBroker) -> RabbitCog:
+    cog = RabbitCog(types.SimpleNamespace(data={}))
+
+    async def echo(body, files):
+        if body.get("fail"):
+            raise RuntimeError("boom")
+        return types.SimpleNamespace(id=42)
+
+    cog.register_action("echo", echo)
+    cog.replies = ReplyPublisher(broker.channel(), window=0.01)
+    return cog
+
+
+async def consume(cog: RabbitCog, message: FakeIncomingMessage):
+    await cog.on_rabbit_message(message)
+    await cog.replies.flush()
+
+
+def test_reply_carries_correlation_id_and_result():
+    async def main():
+        broker = FakeBroker()
+        cog = make_cog(broker)
+        message = FakeIncomingMessage(
+            {"action": "echo"}, reply_to="replies", correlation_id="abc"
+        )
+        await consume(cog, message)
+        return broker, message
+
+    broker, message = asyncio.run(main())
+
+    assert message.outcome == "ack"
+    (reply,) = broker.queues["replies"]
+    assert reply.correlation_id == "abc"
+    payload = broker.replies("replies")[0]
+    assert payload["status"] == "ok"
+    assert payload["message_id"] == 42
+    assert payload["latency"] >= 0
+
+
+def test_sent_at_header_is_used_for_latency():
+    async def main():
+        broker = FakeBroker()
+        cog = make_cog(broker)
+        await consume(
+            cog,
+            FakeIncomingMessage(
+                {"action": "echo"}, reply_to="replies", headers={"sent_at": 0.0}
+            ),
+        )
+        return broker
+
+    # Epoch as the send time: the latency is "now"
+    assert asyncio.run(main()).replies("replies")[0]["latency"] > 1e9
+
+
+def test_no_reply_without_reply_to():
+    async def main():
+        broker = FakeBroker()
+        cog = make_cog(broker)
+        await consume(cog, FakeIncomingMessage({"action": "echo"}))
+        return broker
+
+    assert asyncio.run(main()).queues == {}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"action": "nope"},
+        {"action": "send", "message": 5},
+        b"{not json",
+        b"[]",
+    ],
+)
+def test_dropped_messages_are_reported_invalid(body):
+    async def main():
+        broker = FakeBroker()
+        cog = make_cog(broker)
+        message = FakeIncomingMessage(body, reply_to="replies")
+        await consume(cog, message)
+        return broker, message
+
+    broker, message = asyncio.run(main())
+
+    assert message.outcome == "ack"
+    (payload,) = broker.replies("replies")
+    assert payload["status"] == "invalid"
+    assert payload["error"]
+
+
+def test_failures_are_reported_only_when_not_retried():
+    async def main():
+        broker = FakeBroker()
+        cog = make_cog(broker)
+        first = FakeIncomingMessage({"action": "echo", "fail": True}, reply_to="r")
+        with pytest.raises(RuntimeError):
+            await consume(cog, first)
+        await cog.replies.flush()
+        assert broker.queues == {}
+
+        retry = FakeIncomingMessage(
+            {"action": "echo", "fail": True}, reply_to="r", redelivered=True
+        )
+        with pytest.raises(RuntimeError):
+            await consume(cog, retry)
+        await cog.replies.flush()
+        return broker, first, retry
+
+    broker, first, retry = asyncio.run(main())
+
+    assert first.outcome == "requeue"
+    assert retry.outcome == "reject"
+    (payload,) = broker.replies("r")
+    assert payload["status"] == "error"
+    assert payload["error"] == "boom"
+
+
+def test_publisher_batches_until_window():
+    async def main():
+        broker = FakeBroker()
+        publisher = ReplyPublisher(broker.channel(), window=0.05, batch_size=100)
+        for i in range(3):
+            publisher.publish("r", str(i), {"n": i})
+
+        await asyncio.sleep(0)
+        before = len(broker.queues.get("r", []))
+        await asyncio.sleep(0.1)
+        return broker, publisher, before
+
+    broker, publisher, before = asyncio.run(main())
+
+    assert before == 0
+    assert [m.correlation_id for m in broker.queues["r"]] == ["0", "1", "2"]
+    assert publisher.published == 3
+    assert publisher.pending == []
+
+
+def test_publisher_flushes_full_batch_immediately():
+    async def main():
+        broker = FakeBroker()
+        publisher = ReplyPublisher(broker.channel(), window=10.0, batch_size=2)
+        publisher.publish("r", "a", {})
+        publisher.publish("r", "b", {})
+        await asyncio.sleep(0.01)
+        published = len(broker.queues.get("r", []))
+        publisher.flush_task.cancel()
+        return published
+
+    assert asyncio.run(main()) == 2
+
+
+def test_publisher_counts_unconfirmed_replies():
+    async def main():
+        broker = FakeBroker()
+        broker.nack_all = True
+        publisher = ReplyPublisher(broker.channel(), window=0.0)
+        publisher.publish("r", "a", {})
+        publisher.publish("r", "b", {})
+        await publisher.flush()
+        return publisher
+
+    publisher = asyncio.run(main())
+
+    assert publisher.published == 0
+    assert publisher.failed == 2